@@ -2,12 +2,18 @@
 
 from __future__ import annotations
 
+import asyncio
+import base64
+import functools
 import json
+import sqlite3
+import time
 import uuid
 from datetime import datetime, timezone
 from pathlib import Path
+from typing import Any
 
-import aiosqlite
+from sqlite_async import AsyncSqlite
 
 _SCHEMA = """\
 CREATE TABLE IF NOT EXISTS generations (
@@ -24,33 +30,292 @@ CREATE TABLE IF NOT EXISTS generations (
     conversation_history TEXT,
     created_at TEXT NOT NULL
 );
+CREATE INDEX IF NOT EXISTS ix_gen_created_desc ON generations(created_at DESC, id DESC);
 """
 
+# Prompt search index. The trigram tokenizer keeps LIKE's substring semantics,
+# which matters for Japanese prompts that have no word boundaries.
+_FTS_SCHEMA = """\
+CREATE VIRTUAL TABLE IF NOT EXISTS generations_fts USING fts5(
+    prompt, content='generations', content_rowid='rowid', tokenize='trigram'
+);
+CREATE TRIGGER IF NOT EXISTS generations_fts_ai AFTER INSERT ON generations BEGIN
+    INSERT INTO generations_fts(rowid, prompt) VALUES (new.rowid, new.prompt);
+END;
+CREATE TRIGGER IF NOT EXISTS generations_fts_ad AFTER DELETE ON generations BEGIN
+    INSERT INTO generations_fts(generations_fts, rowid, prompt)
+    VALUES ('delete', old.rowid, old.prompt);
+END;
+CREATE TRIGGER IF NOT EXISTS generations_fts_au AFTER UPDATE OF prompt ON generations BEGIN
+    INSERT INTO generations_fts(generations_fts, rowid, prompt)
+    VALUES ('delete', old.rowid, old.prompt);
+    INSERT INTO generations_fts(rowid, prompt) VALUES (new.rowid, new.prompt);
+END;
+"""
 
-class GenerationDB:
-    """Async SQLite wrapper for generation storage."""
+# Trigram FTS cannot match fewer than 3 characters; shorter queries use LIKE.
+_FTS_MIN_QUERY_LEN = 3
+
+# Hot statements are module constants so every call hands sqlite3 the same
+# SQL text and hits its per-connection prepared-statement cache.
+_INSERT_GEN_SQL = """\
+INSERT INTO generations
+    (id, prompt, image_path, code, result_json, step_path,
+     model_used, status, error_message, tags,
+     conversation_history, created_at)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"""
+
+# Rows come back as plain tuples; dicts are built by zipping with these.
+_GEN_COLS = (
+    "id", "prompt", "image_path", "code", "result_json", "step_path",
+    "model_used", "status", "error_message", "tags",
+    "conversation_history", "created_at",
+)
+_LIST_GEN_COLS = ("id", "prompt", "model_used", "status", "created_at")
+
+_GET_GEN_SQL = f"SELECT {', '.join(_GEN_COLS)} FROM generations WHERE id = ?"
+
+_DELETE_GEN_SQL = "DELETE FROM generations WHERE id = ?"
+
+# WHERE clause per search mode: FTS match, short-query LIKE, or everything.
+_GEN_FILTERS = {
+    "fts": "WHERE rowid IN (SELECT rowid FROM generations_fts WHERE generations_fts MATCH ?)",
+    "like": "WHERE prompt LIKE ?",
+    "all": "",
+}
+
+
+def _after_cursor(where: str) -> str:
+    """Extend a WHERE clause with the keyset condition for the next page."""
+    return (f"{where} AND" if where else "WHERE") + " (created_at, id) < (?, ?)"
+
+
+# Keyed by (mode, has_cursor). Pages after the first continue from the last
+# (created_at, id) seen, so each page is one descent of the created_at index
+# instead of walking every skipped row as OFFSET does.
+_LIST_GEN_SQL = {
+    (mode, keyset): (
+        f"SELECT {', '.join(_LIST_GEN_COLS)} FROM generations "
+        + (_after_cursor(where) if keyset else where)
+        + " ORDER BY created_at DESC, id DESC LIMIT ? OFFSET ?"
+    )
+    for mode, where in _GEN_FILTERS.items()
+    for keyset in (False, True)
+}
+
+# The /ai-cad/library response built by SQLite itself, so listing skips
+# Python-side dict construction and JSON encoding. json_group_array keeps the
+# subquery's order.
+_LIST_GEN_JSON_SQL = {
+    key: (
+        "SELECT json_group_array(json_object("
+        "'generation_id', id, 'prompt', prompt, 'model_used', model_used,"
+        " 'status', status, 'created_at', created_at))"
+        f" FROM ({sql})"
+    )
+    for key, sql in _LIST_GEN_SQL.items()
+}
+
+# Columns update_generation may touch, in _UPDATE_GEN_SQL parameter order.
+_UPDATABLE_GEN_FIELDS = (
+    "code", "result_json", "step_path", "status",
+    "error_message", "tags", "conversation_history",
+)
+
+# One fixed statement for every update: a NULL parameter keeps the column.
+_UPDATE_GEN_SQL = (
+    "UPDATE generations SET "
+    + ", ".join(f"{k} = COALESCE(?, {k})" for k in _UPDATABLE_GEN_FIELDS)
+    + " WHERE id = ?"
+)
+
+
+# Bumped whenever init() gains a migration; stored in PRAGMA user_version.
+#   2: generations.conversation_history added
+_SCHEMA_VERSION = 2
+
+# Applied on every new connection, before any schema work, so that table
+# creation already lands in the WAL file.
+_PRAGMAS = """\
+PRAGMA journal_mode=WAL;
+PRAGMA synchronous=NORMAL;
+PRAGMA temp_store=MEMORY;
+PRAGMA cache_size=-64000;
+PRAGMA mmap_size=268435456;
+PRAGMA busy_timeout=5000;
+"""
+
+# sqlite3 keeps this many compiled statements per connection (default 128).
+_STATEMENT_CACHE_SIZE = 256
+
+# Upper bound on statements committed together by one flush.
+_WRITE_BATCH_MAX = 64
+
+
+def _fts_phrase(query: str) -> str:
+    """Quote a user query as a single FTS5 phrase (substring match)."""
+    return '"' + query.replace('"', '""') + '"'
+
+
+def _search_mode(query: str | None) -> tuple[str, tuple]:
+    """Pick the filter mode for a search string and its bound parameters."""
+    if query and len(query) >= _FTS_MIN_QUERY_LEN:
+        return "fts", (_fts_phrase(query),)
+    if query:
+        return "like", (f"%{query}%",)
+    return "all", ()
+
+
+async def _init_fts(conn: AsyncSqlite, fts_table: str, schema: str):
+    """Create an external-content FTS table, backfilling it on first creation."""
+    cursor = await conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (fts_table,)
+    )
+    exists = cursor.fetchone() is not None
+    await conn.executescript(schema)
+    if not exists:
+        await conn.execute(
+            f"INSERT INTO {fts_table}({fts_table}) VALUES ('rebuild')"
+        )
+
+
+# One queued write: its statements, each (sql, params, is_executemany).
+_WriteSteps = list[tuple[str, Any, bool]]
+
+
+def _apply_writes(
+    conn: sqlite3.Connection, batch: list[_WriteSteps]
+) -> list[int | BaseException]:
+    """Run a batch of writes and commit once. Called on the DB worker thread.
+
+    Multi-statement writes run inside a savepoint so they apply all or
+    nothing. Each write's result is the rowcount of its first statement.
+    """
+    results: list[int | BaseException] = []
+    if not conn.in_transaction:
+        conn.execute("BEGIN")
+    for steps in batch:
+        grouped = len(steps) > 1
+        try:
+            if grouped:
+                conn.execute("SAVEPOINT write_group")
+            rowcounts = [
+                (conn.executemany(sql, params) if many else conn.execute(sql, params)).rowcount
+                for sql, params, many in steps
+            ]
+            if grouped:
+                conn.execute("RELEASE write_group")
+            results.append(rowcounts[0])
+        except Exception as e:
+            if grouped:
+                conn.execute("ROLLBACK TO write_group")
+                conn.execute("RELEASE write_group")
+            results.append(e)
+    try:
+        conn.commit()
+    except Exception as e:
+        # Leave no open transaction behind, or the next batch would skip
+        # BEGIN and commit these failed writes along with its own
+        conn.rollback()
+        results = [e] * len(batch)
+    return results
+
+
+class _SQLiteStore:
+    """Shared connection handling and write coalescing for the DB wrappers.
+
+    Writes are queued and committed by a flush task in one transaction per
+    batch, so a burst of saves pays a single fsync instead of one each, and
+    the whole batch reaches the DB thread in a single executor hop.
+    The flush task exits once the queue drains and is restarted on demand
+    on the caller's running loop.
+    """
 
     def __init__(self, db_path: str | Path):
         self._db_path = str(db_path)
-        self._conn: aiosqlite.Connection | None = None
+        self._conn: AsyncSqlite | None = None
+        self._pending: list[tuple[_WriteSteps, asyncio.Future]] = []
+        self._flusher: asyncio.Task | None = None
+
+    async def _open(self):
+        """Open the connection and apply the connection-level PRAGMAs."""
+        self._conn = await AsyncSqlite.connect(
+            self._db_path, cached_statements=_STATEMENT_CACHE_SIZE
+        )
+        await self._conn.executescript(_PRAGMAS)
+
+    async def close(self):
+        flusher = self._flusher
+        if flusher is not None and not flusher.done() \
+                and flusher.get_loop() is asyncio.get_running_loop():
+            await flusher
+        if self._conn:
+            await self._conn.close()
+
+    async def _write(self, sql: str, params: tuple = ()) -> int:
+        """Queue a write statement and wait for its commit. Returns rowcount."""
+        return await self._enqueue([(sql, params, False)])
+
+    async def _write_many(self, sql: str, rows: list[tuple]) -> int:
+        """Queue an executemany over ``rows``; all rows commit together."""
+        return await self._enqueue([(sql, rows, True)])
+
+    async def _write_group(self, statements: list[tuple[str, tuple]]) -> int:
+        """Queue statements that must apply together. Returns the first rowcount."""
+        return await self._enqueue([(sql, params, False) for sql, params in statements])
+
+    async def _enqueue(self, steps: _WriteSteps) -> int:
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self._pending.append((steps, fut))
+        if self._flusher is None or self._flusher.done() \
+                or self._flusher.get_loop() is not loop:
+            self._flusher = loop.create_task(self._flush())
+        return await fut
+
+    async def _flush(self):
+        while self._pending:
+            batch = self._pending[:_WRITE_BATCH_MAX]
+            del self._pending[:len(batch)]
+            try:
+                results = await self._conn.run(
+                    _apply_writes, [steps for steps, _ in batch]
+                )
+            except Exception as e:
+                results = [e] * len(batch)
+            for (_, fut), result in zip(batch, results):
+                if fut.done():
+                    continue
+                if isinstance(result, BaseException):
+                    fut.set_exception(result)
+                else:
+                    fut.set_result(result)
+
+
+class GenerationDB(_SQLiteStore):
+    """Async SQLite wrapper for generation storage."""
 
     async def init(self):
         """Open connection and create tables."""
-        self._conn = await aiosqlite.connect(self._db_path)
-        self._conn.row_factory = aiosqlite.Row
+        await self._open()
         await self._conn.executescript(_SCHEMA)
-        # Migrate: add conversation_history if missing
+        version = (await self._conn.execute("PRAGMA user_version")).fetchone()[0]
+        if version < _SCHEMA_VERSION:
+            await self._migrate()
+        await _init_fts(self._conn, "generations_fts", _FTS_SCHEMA)
+        await self._conn.commit()
+
+    async def _migrate(self):
+        """Bring a database created by an older release up to _SCHEMA_VERSION."""
+        # Migrate: add conversation_history if missing. Databases created
+        # before user_version was tracked report 0, so check the column.
         cursor = await self._conn.execute("PRAGMA table_info(generations)")
-        cols = {row[1] for row in await cursor.fetchall()}
+        cols = {row[1] for row in cursor.fetchall()}
         if "conversation_history" not in cols:
             await self._conn.execute(
                 "ALTER TABLE generations ADD COLUMN conversation_history TEXT"
             )
-        await self._conn.commit()
-
-    async def close(self):
-        if self._conn:
-            await self._conn.close()
+        await self._conn.execute(f"PRAGMA user_version = {_SCHEMA_VERSION}")
 
     async def save_generation(
         self,
@@ -68,51 +333,72 @@ class GenerationDB:
         """Save a generation record. Returns the generation ID."""
         gen_id = uuid.uuid4().hex[:12]
         now = datetime.now(timezone.utc).isoformat()
-        await self._conn.execute(
-            """INSERT INTO generations
-               (id, prompt, image_path, code, result_json, step_path,
-                model_used, status, error_message, tags,
-                conversation_history, created_at)
-               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+        await self._write(
+            _INSERT_GEN_SQL,
             (gen_id, prompt, image_path, code, result_json, step_path,
              model_used, status, error_message, tags,
              conversation_history, now),
         )
-        await self._conn.commit()
         return gen_id
 
+    async def save_generations_many(self, items: list[dict]) -> list[str]:
+        """Save many generation records in one transaction. Returns their IDs.
+
+        Each item takes the same keys as ``save_generation``'s arguments.
+        """
+        now = datetime.now(timezone.utc).isoformat()
+        ids = [uuid.uuid4().hex[:12] for _ in items]
+        rows = [
+            (gen_id, it["prompt"], it.get("image_path"), it["code"],
+             it.get("result_json"), it.get("step_path"), it["model_used"],
+             it["status"], it.get("error_message"), it.get("tags"),
+             it.get("conversation_history"), now)
+            for gen_id, it in zip(ids, items)
+        ]
+        if rows:
+            await self._write_many(_INSERT_GEN_SQL, rows)
+        return ids
+
     async def get_generation(self, gen_id: str) -> dict | None:
         """Get a single generation by ID."""
-        cursor = await self._conn.execute(
-            "SELECT * FROM generations WHERE id = ?", (gen_id,)
-        )
-        row = await cursor.fetchone()
-        return dict(row) if row else None
+        row = (await self._conn.execute(_GET_GEN_SQL, (gen_id,))).fetchone()
+        return dict(zip(_GEN_COLS, row)) if row else None
 
     async def list_generations(
         self,
         search: str | None = None,
         limit: int = 50,
         offset: int = 0,
+        cursor: tuple[str, str] | None = None,
     ) -> list[dict]:
-        """List generations, most recent first."""
-        if search:
-            cursor = await self._conn.execute(
-                """SELECT id, prompt, model_used, status, created_at
-                   FROM generations
-                   WHERE prompt LIKE ?
-                   ORDER BY created_at DESC LIMIT ? OFFSET ?""",
-                (f"%{search}%", limit, offset),
-            )
-        else:
-            cursor = await self._conn.execute(
-                """SELECT id, prompt, model_used, status, created_at
-                   FROM generations
-                   ORDER BY created_at DESC LIMIT ? OFFSET ?""",
-                (limit, offset),
-            )
-        rows = await cursor.fetchall()
-        return [dict(r) for r in rows]
+        """List generations, most recent first.
+
+        ``cursor`` is the ``(created_at, id)`` of the last row of the previous
+        page; when given, the page starts right after it.
+        """
+        mode, params = _search_mode(search)
+        if cursor is not None:
+            params += tuple(cursor)
+        result = await self._conn.execute(
+            _LIST_GEN_SQL[mode, cursor is not None], (*params, limit, offset)
+        )
+        return [dict(zip(_LIST_GEN_COLS, r)) for r in result.fetchall()]
+
+    async def list_generations_json(
+        self,
+        search: str | None = None,
+        limit: int = 50,
+        offset: int = 0,
+        cursor: tuple[str, str] | None = None,
+    ) -> str:
+        """Like ``list_generations`` but returns the library response as JSON text."""
+        mode, params = _search_mode(search)
+        if cursor is not None:
+            params += tuple(cursor)
+        result = await self._conn.execute(
+            _LIST_GEN_JSON_SQL[mode, cursor is not None], (*params, limit, offset)
+        )
+        return result.fetchone()[0]
 
     async def update_generation(
         self,
@@ -120,24 +406,14 @@ class GenerationDB:
         **fields,
     ) -> None:
         """Update fields on an existing generation record."""
-        allowed = {"code", "result_json", "step_path", "status",
-                   "error_message", "tags", "conversation_history"}
-        updates = {k: v for k, v in fields.items() if k in allowed and v is not None}
-        if not updates:
+        values = tuple(fields.get(k) for k in _UPDATABLE_GEN_FIELDS)
+        if all(v is None for v in values):
             return
-        set_clause = ", ".join(f"{k} = ?" for k in updates)
-        values = list(updates.values()) + [gen_id]
-        await self._conn.execute(
-            f"UPDATE generations SET {set_clause} WHERE id = ?", values
-        )
-        await self._conn.commit()
+        await self._write(_UPDATE_GEN_SQL, (*values, gen_id))
 
     async def delete_generation(self, gen_id: str):
         """Delete a generation record."""
-        await self._conn.execute(
-            "DELETE FROM generations WHERE id = ?", (gen_id,)
-        )
-        await self._conn.commit()
+        await self._write(_DELETE_GEN_SQL, (gen_id,))
 
 
 # ── Snippet DB ────────────────────────────────────────────────────────────────
@@ -153,65 +429,340 @@ CREATE TABLE IF NOT EXISTS snippets (
     created_at TEXT NOT NULL,
     updated_at TEXT NOT NULL
 );
+CREATE INDEX IF NOT EXISTS ix_snip_created_desc ON snippets(created_at DESC, id DESC);
+CREATE TABLE IF NOT EXISTS snippet_thumbnails (
+    snippet_id TEXT PRIMARY KEY,
+    png BLOB NOT NULL
+);
+CREATE TRIGGER IF NOT EXISTS snippet_thumbnails_ad AFTER DELETE ON snippets BEGIN
+    DELETE FROM snippet_thumbnails WHERE snippet_id = old.id;
+END;
+"""
+
+_SNIPPETS_FTS_SCHEMA = """\
+CREATE VIRTUAL TABLE IF NOT EXISTS snippets_fts USING fts5(
+    name, content='snippets', content_rowid='rowid', tokenize='trigram'
+);
+CREATE TRIGGER IF NOT EXISTS snippets_fts_ai AFTER INSERT ON snippets BEGIN
+    INSERT INTO snippets_fts(rowid, name) VALUES (new.rowid, new.name);
+END;
+CREATE TRIGGER IF NOT EXISTS snippets_fts_ad AFTER DELETE ON snippets BEGIN
+    INSERT INTO snippets_fts(snippets_fts, rowid, name)
+    VALUES ('delete', old.rowid, old.name);
+END;
+CREATE TRIGGER IF NOT EXISTS snippets_fts_au AFTER UPDATE OF name ON snippets BEGIN
+    INSERT INTO snippets_fts(snippets_fts, rowid, name)
+    VALUES ('delete', old.rowid, old.name);
+    INSERT INTO snippets_fts(rowid, name) VALUES (new.rowid, new.name);
+END;
 """
 
+# Normalized copy of each snippet's tags, kept in sync from the JSON column by
+# triggers, so tag filters are index lookups rather than scans of the JSON.
+_SNIPPET_TAGS_SCHEMA = """\
+CREATE TABLE IF NOT EXISTS snippet_tags (
+    snippet_id TEXT NOT NULL,
+    tag TEXT NOT NULL,
+    PRIMARY KEY (snippet_id, tag)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ix_snippet_tag ON snippet_tags(tag);
+CREATE TRIGGER IF NOT EXISTS snippet_tags_ai AFTER INSERT ON snippets BEGIN
+    INSERT OR IGNORE INTO snippet_tags (snippet_id, tag)
+    SELECT new.id, value FROM json_each(coalesce(new.tags, '[]'));
+END;
+CREATE TRIGGER IF NOT EXISTS snippet_tags_ad AFTER DELETE ON snippets BEGIN
+    DELETE FROM snippet_tags WHERE snippet_id = old.id;
+END;
+CREATE TRIGGER IF NOT EXISTS snippet_tags_au AFTER UPDATE OF tags ON snippets BEGIN
+    DELETE FROM snippet_tags WHERE snippet_id = old.id;
+    INSERT OR IGNORE INTO snippet_tags (snippet_id, tag)
+    SELECT new.id, value FROM json_each(coalesce(new.tags, '[]'));
+END;
+"""
 
-class SnippetsDB:
-    """Async SQLite wrapper for snippet storage."""
+_INSERT_SNIPPET_SQL = (
+    "INSERT INTO snippets (id, name, tags, code, source_generation_id, created_at, updated_at)"
+    " VALUES (?, ?, ?, ?, ?, ?, ?)"
+)
 
-    def __init__(self, db_path: str | Path):
-        self._db_path = str(db_path)
-        self._conn: aiosqlite.Connection | None = None
+# Thumbnails live in their own table so snippet rows stay small; the legacy
+# snippets.thumbnail_png column is emptied on init and no longer written.
+_INSERT_THUMBNAIL_SQL = "INSERT OR REPLACE INTO snippet_thumbnails (snippet_id, png) VALUES (?, ?)"
+
+_GET_THUMBNAIL_SQL = "SELECT png FROM snippet_thumbnails WHERE snippet_id = ?"
+
+_SNIPPET_COLS = (
+    "id", "name", "tags", "code", "source_generation_id",
+    "created_at", "updated_at", "has_thumbnail",
+)
+
+_SNIPPET_SELECT = (
+    "id, name, tags, code, source_generation_id, created_at, updated_at,"
+    " EXISTS (SELECT 1 FROM snippet_thumbnails t WHERE t.snippet_id = snippets.id)"
+    " AS has_thumbnail"
+)
+
+_GET_SNIPPET_SQL = f"SELECT {_SNIPPET_SELECT} FROM snippets WHERE id = ?"
+
+_DELETE_SNIPPET_SQL = "DELETE FROM snippets WHERE id = ?"
+
+# Condition per search mode: FTS match, short-query LIKE, or everything.
+_SNIPPET_FILTERS = {
+    "fts": "rowid IN (SELECT rowid FROM snippets_fts WHERE snippets_fts MATCH ?)",
+    "like": "name LIKE ?",
+    "all": "",
+}
+
+
+@functools.cache
+def _snippet_where(mode: str, n_tags: int) -> str:
+    """WHERE clause for a search mode, optionally requiring ``n_tags`` tags.
+
+    The tag condition binds the tags followed by their count.
+    """
+    conds = [_SNIPPET_FILTERS[mode]] if _SNIPPET_FILTERS[mode] else []
+    if n_tags:
+        conds.append(
+            "id IN (SELECT snippet_id FROM snippet_tags"
+            f" WHERE tag IN ({', '.join('?' * n_tags)})"
+            " GROUP BY snippet_id HAVING COUNT(*) = ?)"
+        )
+    return "WHERE " + " AND ".join(conds) if conds else ""
+
+
+# The count rides along with the page, so one round trip returns both the
+# rows and the total match count. On the first page a window count suffices;
+# keyset pages filter out earlier rows, so they count the full match set in a
+# scalar subquery instead.
+@functools.cache
+def _list_snippets_sql(mode: str, keyset: bool, n_tags: int) -> str:
+    where = _snippet_where(mode, n_tags)
+    return (
+        f"SELECT {_SNIPPET_SELECT}, "
+        + (f"(SELECT COUNT(*) FROM snippets {where})" if keyset else "COUNT(*) OVER ()")
+        + " AS _total FROM snippets "
+        + (_after_cursor(where) if keyset else where)
+        + " ORDER BY created_at DESC, id DESC LIMIT ? OFFSET ?"
+    )
+
+
+# The whole /snippets response as one JSON document. next_cursor is the
+# smallest (created_at, id) on a full page; ISO timestamps never prefix one
+# another, so comparing the joined string matches the tuple order.
+@functools.cache
+def _list_snippets_json_sql(mode: str, keyset: bool, n_tags: int) -> str:
+    where = _snippet_where(mode, n_tags)
+    return (
+        "SELECT json_object('snippets', json_group_array(json_object("
+        "'id', id, 'name', name, 'tags', json(coalesce(tags, '[]')), 'code', code,"
+        " 'thumbnail_url', CASE WHEN has_thumbnail THEN '/snippets/' || id || '/thumbnail' END,"
+        " 'source_generation_id', source_generation_id, 'created_at', created_at)),"
+        f" 'total', (SELECT COUNT(*) FROM snippets {where}),"
+        " 'next_cursor', CASE WHEN count(*) = ? THEN min(created_at || ',' || id) END)"
+        f" FROM (SELECT {_SNIPPET_SELECT} FROM snippets "
+        + (_after_cursor(where) if keyset else where)
+        + " ORDER BY created_at DESC, id DESC LIMIT ? OFFSET ?)"
+    )
+
+
+@functools.cache
+def _count_snippets_sql(mode: str, n_tags: int) -> str:
+    return f"SELECT COUNT(*) FROM snippets {_snippet_where(mode, n_tags)}"
+
+
+def _snippet_filter(q: str, tags: list[str] | None) -> tuple[str, int, tuple]:
+    """Search mode, tag count and bound parameters for a snippet filter."""
+    mode, params = _search_mode(q)
+    tags = list(dict.fromkeys(tags or []))
+    if tags:
+        params += (*tags, len(tags))
+    return mode, len(tags), params
+
+
+async def _init_snippet_tags(conn: AsyncSqlite):
+    """Create the snippet tag table, filling it from existing rows on creation."""
+    cursor = await conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'snippet_tags'"
+    )
+    exists = cursor.fetchone() is not None
+    await conn.executescript(_SNIPPET_TAGS_SCHEMA)
+    if not exists:
+        await conn.execute(
+            "INSERT OR IGNORE INTO snippet_tags (snippet_id, tag)"
+            " SELECT s.id, t.value FROM snippets s, json_each(coalesce(s.tags, '[]')) t"
+        )
+
+
+def _png_bytes(thumbnail: bytes | str) -> bytes:
+    """PNG bytes from raw bytes, base64 text, or a ``data:image/png`` URL."""
+    if isinstance(thumbnail, bytes):
+        return thumbnail
+    _, _, data = thumbnail.rpartition(",")
+    return base64.b64decode(data, validate=True)
+
+
+async def _migrate_thumbnails(conn: AsyncSqlite):
+    """Move thumbnails still stored inline as base64 text into snippet_thumbnails."""
+    cursor = await conn.execute(
+        "SELECT id, thumbnail_png FROM snippets WHERE thumbnail_png IS NOT NULL"
+    )
+    rows = cursor.fetchall()
+    if not rows:
+        return
+    thumbnails = []
+    for sid, png in rows:
+        try:
+            thumbnails.append((sid, _png_bytes(png)))
+        except ValueError:
+            # The old column took any text; an undecodable one is dropped
+            # rather than blocking init on every start
+            continue
+    await conn.executemany(_INSERT_THUMBNAIL_SQL, thumbnails)
+    await conn.execute("UPDATE snippets SET thumbnail_png = NULL WHERE thumbnail_png IS NOT NULL")
+
+
+class SnippetsDB(_SQLiteStore):
+    """Async SQLite wrapper for snippet storage."""
 
     async def init(self):
-        self._conn = await aiosqlite.connect(self._db_path)
-        self._conn.row_factory = aiosqlite.Row
+        await self._open()
         await self._conn.executescript(_SNIPPETS_SCHEMA)
+        await _init_fts(self._conn, "snippets_fts", _SNIPPETS_FTS_SCHEMA)
+        await _init_snippet_tags(self._conn)
+        await _migrate_thumbnails(self._conn)
         await self._conn.commit()
 
-    async def close(self):
-        if self._conn:
-            await self._conn.close()
-
     async def save_snippet(
         self,
         name: str,
         code: str,
         tags: list[str] | None = None,
-        thumbnail_png: str | None = None,
+        thumbnail_png: bytes | str | None = None,
         source_generation_id: str | None = None,
     ) -> str:
+        """Save a snippet. ``thumbnail_png`` may be bytes or base64 / data URL text."""
         snippet_id = uuid.uuid4().hex[:12]
         now = datetime.now(timezone.utc).isoformat()
-        await self._conn.execute(
-            "INSERT INTO snippets (id, name, tags, code, thumbnail_png, source_generation_id, created_at, updated_at)"
-            " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
-            (snippet_id, name, json.dumps(tags or []), code, thumbnail_png, source_generation_id, now, now),
-        )
-        await self._conn.commit()
+        statements: list[tuple[str, tuple]] = [(
+            _INSERT_SNIPPET_SQL,
+            (snippet_id, name, json.dumps(tags or []), code, source_generation_id, now, now),
+        )]
+        if thumbnail_png:
+            statements.append((_INSERT_THUMBNAIL_SQL, (snippet_id, _png_bytes(thumbnail_png))))
+        await self._write_group(statements)
         return snippet_id
 
+    async def save_snippets_many(self, items: list[dict]) -> list[str]:
+        """Save many snippets in one transaction. Returns their IDs.
+
+        Each item takes the same keys as ``save_snippet``'s arguments.
+        """
+        now = datetime.now(timezone.utc).isoformat()
+        ids = [uuid.uuid4().hex[:12] for _ in items]
+        rows = [
+            (snippet_id, it["name"], json.dumps(it.get("tags") or []), it["code"],
+             it.get("source_generation_id"), now, now)
+            for snippet_id, it in zip(ids, items)
+        ]
+        thumbs = [
+            (snippet_id, _png_bytes(it["thumbnail_png"]))
+            for snippet_id, it in zip(ids, items) if it.get("thumbnail_png")
+        ]
+        if rows:
+            await self._enqueue(
+                [(_INSERT_SNIPPET_SQL, rows, True), (_INSERT_THUMBNAIL_SQL, thumbs, True)]
+            )
+        return ids
+
     async def get_snippet(self, snippet_id: str) -> dict | None:
-        cursor = await self._conn.execute("SELECT * FROM snippets WHERE id = ?", (snippet_id,))
-        row = await cursor.fetchone()
-        return dict(row) if row else None
+        row = (await self._conn.execute(_GET_SNIPPET_SQL, (snippet_id,))).fetchone()
+        return dict(zip(_SNIPPET_COLS, row)) if row else None
+
+    async def get_snippet_thumbnail(self, snippet_id: str) -> bytes | None:
+        row = (await self._conn.execute(_GET_THUMBNAIL_SQL, (snippet_id,))).fetchone()
+        return row[0] if row else None
 
     async def list_snippets(
-        self, q: str = "", limit: int = 50, offset: int = 0
+        self,
+        q: str = "",
+        limit: int = 50,
+        offset: int = 0,
+        cursor: tuple[str, str] | None = None,
+        tags: list[str] | None = None,
     ) -> tuple[list[dict], int]:
-        search_val = f"%{q}%"
-        cursor = await self._conn.execute(
-            "SELECT * FROM snippets WHERE name LIKE ? ORDER BY created_at DESC LIMIT ? OFFSET ?",
-            (search_val, limit, offset),
+        """List snippets, newest first. ``tags`` keeps snippets having all of them."""
+        mode, n_tags, params = _snippet_filter(q, tags)
+        if cursor is not None:
+            # Count subquery params come first, then the page filter + keyset.
+            query_params = (*params, *params, *cursor, limit, offset)
+        else:
+            query_params = (*params, limit, offset)
+        result = await self._conn.execute(
+            _list_snippets_sql(mode, cursor is not None, n_tags), query_params
         )
-        rows = await cursor.fetchall()
-        count_cursor = await self._conn.execute(
-            "SELECT COUNT(*) FROM snippets WHERE name LIKE ?", (search_val,)
+        fetched = result.fetchall()
+        # _total is the trailing column; zip stops before it.
+        rows = [dict(zip(_SNIPPET_COLS, r)) for r in fetched]
+        if fetched:
+            total = fetched[0][-1]
+        elif offset > 0 or cursor is not None:
+            # Page past the end: no row to carry the count, ask for it directly
+            count = await self._conn.execute(_count_snippets_sql(mode, n_tags), params)
+            total = count.fetchone()[0]
+        else:
+            total = 0
+        return rows, total
+
+    async def list_snippets_json(
+        self,
+        q: str = "",
+        limit: int = 50,
+        offset: int = 0,
+        cursor: tuple[str, str] | None = None,
+        tags: list[str] | None = None,
+    ) -> str:
+        """Like ``list_snippets`` but returns the /snippets response as JSON text."""
+        mode, n_tags, params = _snippet_filter(q, tags)
+        page_params = (*params, *cursor) if cursor is not None else params
+        result = await self._conn.execute(
+            _list_snippets_json_sql(mode, cursor is not None, n_tags),
+            (*params, limit, *page_params, limit, offset),
         )
-        total = (await count_cursor.fetchone())[0]
-        return [dict(r) for r in rows], total
+        return result.fetchone()[0]
 
     async def delete_snippet(self, snippet_id: str) -> bool:
-        cursor = await self._conn.execute("DELETE FROM snippets WHERE id = ?", (snippet_id,))
-        await self._conn.commit()
-        return cursor.rowcount > 0
+        rowcount = await self._write(_DELETE_SNIPPET_SQL, (snippet_id,))
+        return rowcount > 0
+
+
+# ── LLM code cache ────────────────────────────────────────────────────────────
+
+_CODE_CACHE_SCHEMA = """\
+CREATE TABLE IF NOT EXISTS code_cache (
+    key TEXT PRIMARY KEY,
+    code TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+_GET_CACHED_CODE_SQL = "SELECT code FROM code_cache WHERE key = ? AND expires_at > ?"
+_PUT_CACHED_CODE_SQL = "INSERT OR REPLACE INTO code_cache (key, code, expires_at) VALUES (?, ?, ?)"
+_PURGE_CACHED_CODE_SQL = "DELETE FROM code_cache WHERE expires_at <= ?"
+
+
+class CodeCacheDB(_SQLiteStore):
+    """Exact-match cache of generated code, keyed by a request hash."""
+
+    async def init(self):
+        """Open connection, create the table and drop expired entries."""
+        await self._open()
+        await self._conn.executescript(_CODE_CACHE_SCHEMA)
+        await self._write(_PURGE_CACHED_CODE_SQL, (time.time(),))
+
+    async def get(self, key: str) -> str | None:
+        cursor = await self._conn.execute(_GET_CACHED_CODE_SQL, (key, time.time()))
+        row = cursor.fetchone()
+        return row[0] if row else None
+
+    async def put(self, key: str, code: str, ttl: float):
+        await self._write(_PUT_CACHED_CODE_SQL, (key, code, time.time() + ttl))
@@ -6,16 +6,57 @@ Supports multiple models switchable at runtime.
 
 from __future__ import annotations
 
+import asyncio
+import base64
+import functools
+import hashlib
+import json
+import logging
 import os
-import re
+import time
+from collections import OrderedDict
 from collections.abc import Awaitable, Callable
 from pathlib import Path
 
-from openai import AsyncOpenAI
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
 
-from nodes.ai_cad import execute_build123d_code, CodeExecutionError
+from db import CodeCacheDB
 from schemas import BrepObject
 
+logger = logging.getLogger(__name__)
+
+# Keep connections to OpenRouter warm between pipeline stages; the SDK default
+# drops idle sockets after 5s, shorter than a typical code execution.
+_HTTP_LIMITS = httpx.Limits(
+    max_connections=128, max_keepalive_connections=64, keepalive_expiry=60,
+)
+_HTTP_TIMEOUT = httpx.Timeout(connect=5, read=120, write=10, pool=5)
+
+# Retry prompts carry the execution error; long tracebacks are cut to bound
+# the prompt the model has to process before answering.
+_MAX_ERROR_CHARS = 2000
+# Optional on-disk cache of generate() output (AI_CAD_DISK_CACHE=1)
+_CODE_CACHE_PATH = Path(__file__).parent / "data" / "llm_cache.db"
+_CODE_CACHE_TTL = 7 * 86400
+
+# Prompts that get the full API reference in ``generate``: advanced features
+# the cheatsheets only touch on, or long, detailed requests.
+_REFERENCE_KEYWORDS = (
+    "spline", "loft", "sweep", "thread", "helix", "revolve",
+    "スプライン", "ロフト", "スイープ", "ねじ", "らせん", "回転体",
+)
+_REFERENCE_PROMPT_CHARS = 200
+
+# Successful generate_and_execute results kept per client, keyed on the
+# normalized prompt; a repeat request skips both the LLM and build123d.
+_RESULT_CACHE_SIZE = 128
+
+_RETRY_TEMPLATE = (
+    "Your code produced an error:\n{error}\n\n"
+    "Fix the code and output only the corrected version."
+)
+
 PIPELINE_MODELS = {
     "designer": "google/gemini-2.5-flash-lite",
     "coder": "qwen/qwen3-coder-next",
@@ -39,6 +80,14 @@ AVAILABLE_MODELS: dict[str, dict] = {
     },
 }
 
+# Capability lookups run several times per pipeline; the model table is static
+_VISION_MODELS = frozenset(
+    mid for mid, info in AVAILABLE_MODELS.items() if info.get("supports_vision")
+)
+_LARGE_CONTEXT_MODELS = frozenset(
+    mid for mid, info in AVAILABLE_MODELS.items() if info.get("large_context")
+)
+
 _BASE_PROMPT = """\
 You are a build123d expert generating Python code for CNC-machinable parts.
 
@@ -50,6 +99,11 @@ RULES:
 - Use Builder API (BuildPart) as default — it handles patterns, fillets, and holes cleanly
 - Use Algebra API only for trivially simple shapes (e.g. single box, one boolean)
 - Output ONLY code, no explanations
+- Builder result is bp.part (NOT bp or part)
+
+COMMON API (all profiles):
+Place: Pos(x,y,z) * shape | Rot(0,0,45) * shape
+Pattern: Locations(pts) | GridLocations(xs,ys,xn,yn) | PolarLocations(r,n)
 """
 
 _GENERAL_CHEATSHEET = """\
@@ -62,8 +116,6 @@ _GENERAL_CHEATSHEET = """\
 Ops: extrude(amount=d) | revolve(axis=) | loft() | sweep() | fillet(edges,r) | chamfer(edges,l)
      offset(amount=-t, openings=f) | mirror(about=Plane.YZ) | make_face()
 Bool: A - B (subtract) | A + B (union) | A & B (intersect)
-Place: Pos(x,y,z) * shape | Rot(0,0,45) * shape
-Pattern: Locations(pts) | GridLocations(xs,ys,xn,yn) | PolarLocations(r,n)
 Plane: Plane.XY | Plane.XZ | Plane.XY.offset(20) | path.line ^ 0
 Select: .sort_by(Axis.Z)[-1] (top) | .group_by(Axis.Z)[-1] (top group)
         .filter_by(Axis.Z) (vertical) | .filter_by(GeomType.CIRCLE) (circular)
@@ -88,8 +140,6 @@ Select: .sort_by(Axis.Z)[-1] (top) | .group_by(Axis.Z)[-1] (top group)
 7. sort_by()[-1] = ONE element; group_by()[-1] = LIST
    fillet(bp.edges().group_by(Axis.Z)[-1], radius=2)
 
-8. Builder result: bp.part (NOT bp or part)
-
 ═══ PATTERNS ═══
 
 # Simple plate with holes (Algebra):
@@ -141,8 +191,6 @@ KEY SETUP:
 1D: Line(p1,p2) | Polyline(*pts) | Spline(*pts) | CenterArc(c,r,start,arc)
     make_face() — REQUIRED after BuildLine
 Ops: extrude(amount=d) | extrude(amount=-d, mode=Mode.SUBTRACT) | offset(amount=d)
-Place: Pos(x,y,z) * shape | Rot(0,0,45) * shape
-Pattern: Locations(pts) | GridLocations(xs,ys,xn,yn) | PolarLocations(r,n)
 Select: .sort_by(Axis.Z)[-1] (top face) | .sort_by(Axis.Z)[0] (bottom)
 
 ═══ PITFALLS — READ CAREFULLY ═══
@@ -155,7 +203,6 @@ Select: .sort_by(Axis.Z)[-1] (top face) | .sort_by(Axis.Z)[0] (bottom)
 6. USE Align.MIN for sheet parts — origin at corner makes dimensions intuitive
    Box(300, 200, thickness, align=(Align.MIN, Align.MIN, Align.MIN))
 7. DEFAULT ALIGNMENT IS CENTER — without Align.MIN, Box(100,50,18) spans -50..50
-8. Builder result: bp.part (NOT bp or part)
 
 ═══ PATTERNS ═══
 
@@ -233,8 +280,6 @@ KEY RULES:
     RadiusArc(p1,p2,r) | make_face() — REQUIRED after BuildLine
 Ops: extrude(amount=d) | extrude(amount=-d, mode=Mode.SUBTRACT)
      offset(amount=d) | mirror(about=Plane.YZ)
-Place: Pos(x,y,z) * shape | Rot(0,0,45) * shape
-Pattern: Locations(pts) | GridLocations(xs,ys,xn,yn) | PolarLocations(r,n)
 
 ═══ PITFALLS ═══
 
@@ -243,8 +288,7 @@ Pattern: Locations(pts) | GridLocations(xs,ys,xn,yn) | PolarLocations(r,n)
 3. make_face() を忘れると extrude できない
 4. 穴は Mode.SUBTRACT で別の extrude を行う
 5. DEFAULT ALIGNMENT IS CENTER — align=(Align.MIN, Align.MIN, Align.MIN) 推奨
-6. Builder result: bp.part (NOT bp or part)
-7. thickness 変数を定義して extrude(amount=thickness) とする
+6. thickness 変数を定義して extrude(amount=thickness) とする
 
 ═══ PATTERNS ═══
 
@@ -296,7 +340,6 @@ KEY RULES:
 Ops: extrude(amount=d) | revolve(axis=Axis.Y) | loft() | sweep()
      fillet(edges,r) | chamfer(edges,l) | offset(amount=-t, openings=f)
 Bool: A - B (subtract) | A + B (union) | A & B (intersect)
-Place: Pos(x,y,z) * shape | Rot(0,0,45) * shape
 Plane: Plane.XY | Plane.XZ | Plane.XY.offset(20)
 Select: .sort_by(Axis.Z)[-1] (top) | .group_by(Axis.Z)[-1] (top group)
         .filter_by(GeomType.CIRCLE) (circular)
@@ -308,7 +351,6 @@ Select: .sort_by(Axis.Z)[-1] (top) | .group_by(Axis.Z)[-1] (top group)
 3. fillet/chamfer は BuildPart 内でのみ使用
 4. Spline で滑らかな断面を作り、revolve で回転体にする
 5. offset(openings=face) でシェル化（中空化）する
-6. Builder result: bp.part (NOT bp or part)
 
 ═══ PATTERNS ═══
 
@@ -391,15 +433,37 @@ def _load_reference_file(path: str) -> str:
     return _REFERENCE_CACHE[path]
 
 
+# Read the references at import so the first large-context request does not
+# block the event loop on disk I/O.
+for _path in _REF_PATHS.values():
+    _load_reference_file(_path)
+
+
+def _compact_cheatsheet(cheatsheet: str) -> str:
+    """Quick reference and pitfalls only; the worked PATTERNS section is dropped."""
+    end = cheatsheet.find("═══ PATTERNS ═══")
+    return cheatsheet if end < 0 else cheatsheet[:end].rstrip() + "\n"
+
+
 def _build_system_prompt(
     profile: str = "general",
     include_reference: bool = False,
+    compact: bool = False,
 ) -> str:
-    """Build system prompt from base + profile cheatsheet + optional full reference."""
+    """Build system prompt from base + optional full reference + profile cheatsheet.
+
+    The profile-independent parts come first so every profile shares one long
+    cacheable prefix; only the cheatsheet at the end differs.
+    ``compact`` trims the cheatsheet for small-context models, where every
+    extra KB of prompt delays the first token.
+    """
     p = _PROFILES.get(profile)
     if p is None:
         p = _PROFILES["general"]
-    prompt = _BASE_PROMPT + p["cheatsheet"]
+    cheatsheet = p["cheatsheet"]
+    if compact:
+        cheatsheet = _compact_cheatsheet(cheatsheet)
+    prompt = _BASE_PROMPT
 
     if include_reference:
         examples = _load_reference_file(_REF_PATHS["examples"])
@@ -409,9 +473,81 @@ def _build_system_prompt(
         if api_ref:
             prompt += "\n\n═══ API REFERENCE ═══\n" + api_ref
 
-    return prompt
+    return prompt + cheatsheet
+
+
+_SYSTEM_MESSAGES: dict[tuple, dict] = {}
+
 
-_CODE_FENCE_RE = re.compile(r"```(?:python)?\s*\n?(.*?)\n?\s*```", re.DOTALL)
+def _system_message(
+    profile: str = "general",
+    include_reference: bool = False,
+    compact: bool = False,
+) -> dict:
+    """System message for a profile, built once and shared across calls.
+
+    The prompt is sent as a single text block marked for prompt caching, so
+    providers that support it (Anthropic, Gemini via OpenRouter) reuse the
+    prefill of this large, unchanging prefix. Others ignore the marker.
+    """
+    # Unknown profiles fall back to "general"; resolve first so arbitrary
+    # profile strings from requests can't each add an entry
+    if profile not in _PROFILES:
+        profile = "general"
+    key = (profile, include_reference, compact)
+    msg = _SYSTEM_MESSAGES.get(key)
+    if msg is None:
+        msg = {
+            "role": "system",
+            "content": [{
+                "type": "text",
+                "text": _build_system_prompt(profile, include_reference, compact),
+                "cache_control": {"type": "ephemeral"},
+            }],
+        }
+        _SYSTEM_MESSAGES[key] = msg
+    return msg
+
+
+class _RateLimiter:
+    """Token buckets over requests and prompt tokens per minute.
+
+    A limit of 0 disables that bucket. Waiters queue on a lock, so callers
+    are served in arrival order instead of all retrying at once.
+    """
+
+    def __init__(self, rpm: int, tpm: int):
+        self._rpm = rpm
+        self._tpm = tpm
+        self._requests = float(rpm)
+        self._tokens = float(tpm)
+        self._stamp = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, tokens: int) -> None:
+        async with self._lock:
+            if self._tpm:
+                # A request larger than the whole budget waits for a full bucket
+                tokens = min(tokens, self._tpm)
+            while True:
+                now = time.monotonic()
+                elapsed, self._stamp = now - self._stamp, now
+                wait = 0.0
+                if self._rpm:
+                    self._requests = min(
+                        self._rpm, self._requests + elapsed * self._rpm / 60
+                    )
+                    wait = max(wait, (1 - self._requests) * 60 / self._rpm)
+                if self._tpm:
+                    self._tokens = min(
+                        self._tpm, self._tokens + elapsed * self._tpm / 60
+                    )
+                    wait = max(wait, (tokens - self._tokens) * 60 / self._tpm)
+                if wait <= 0:
+                    self._requests -= 1
+                    self._tokens -= tokens
+                    return
+                await asyncio.sleep(wait)
 
 
 class LLMClient:
@@ -427,28 +563,143 @@ class LLMClient:
             "AI_CAD_DEFAULT_MODEL", "google/gemini-2.5-flash-lite"
         )
         self.max_retries = int(os.environ.get("AI_CAD_MAX_RETRIES", "2"))
+        # Race a design-less coding attempt against the design stage
+        self.speculative = os.environ.get("AI_CAD_SPECULATIVE", "") == "1"
+        # Draft each generate_and_execute retry while the previous attempt
+        # runs; such drafts never see the execution error
+        self.speculative_retry = os.environ.get("AI_CAD_SPECULATIVE_RETRY", "") == "1"
+        # Independent first drafts raced by generate_and_execute
+        self.speculative_k = int(os.environ.get("AI_CAD_SPECULATIVE_K", "1"))
+        # Cap in-flight completions so bursts queue here instead of
+        # tripping provider rate limits and the SDK's backoff sleeps
+        self._slots = asyncio.Semaphore(
+            int(os.environ.get("AI_CAD_MAX_CONCURRENT", "32"))
+        )
+        # Optional provider quota, off unless AI_CAD_RPM / AI_CAD_TPM are set
+        rpm = int(os.environ.get("AI_CAD_RPM", "0"))
+        tpm = int(os.environ.get("AI_CAD_TPM", "0"))
+        self._rate = _RateLimiter(rpm, tpm) if rpm or tpm else None
+        self._results: OrderedDict[tuple, tuple] = OrderedDict()
+        self._code_cache: CodeCacheDB | None = None
+        self._code_cache_ready: asyncio.Task | None = None
+        if os.environ.get("AI_CAD_DISK_CACHE", "") == "1":
+            self._code_cache = CodeCacheDB(_CODE_CACHE_PATH)
         self._client = AsyncOpenAI(
             base_url="https://openrouter.ai/api/v1",
             api_key=key,
             default_headers={"HTTP-Referer": "https://pathdesigner.local"},
+            timeout=_HTTP_TIMEOUT,
+            http_client=DefaultAsyncHttpxClient(limits=_HTTP_LIMITS),
         )
 
+    async def close(self) -> None:
+        """Close the pooled HTTP connections and the code cache."""
+        await self._client.close()
+        if self._code_cache_ready is not None:
+            await self._code_cache.close()
+
+    async def _cached_code_db(self) -> CodeCacheDB | None:
+        """The disk code cache, opened on first use; None when disabled."""
+        if self._code_cache is None:
+            return None
+        if self._code_cache_ready is None:
+            self._code_cache_ready = asyncio.create_task(self._code_cache.init())
+        try:
+            await self._code_cache_ready
+        except Exception:
+            # Don't pin the failure: the next call tries to open it again
+            self._code_cache_ready = None
+            raise
+        return self._code_cache
+
+    async def _throttle(self, messages: list[dict]) -> None:
+        """Wait for quota under AI_CAD_RPM / AI_CAD_TPM, if configured."""
+        if self._rate is not None:
+            await self._rate.acquire(_estimate_tokens(messages))
+
+    async def _complete(self, *, model: str, messages: list[dict]):
+        """Send one chat completion, logging how much of the prompt hit the cache."""
+        async with self._slots:
+            await self._throttle(messages)
+            response = await self._client.chat.completions.create(
+                model=model,
+                messages=messages,  # type: ignore[arg-type]
+                # OpenRouter usage accounting: reports cached prompt tokens
+                extra_body={"usage": {"include": True}},
+            )
+        _log_usage(model, getattr(response, "usage", None))
+        return response
+
+    async def _complete_code(self, *, model: str, messages: list[dict]) -> str:
+        """Stream a completion and return its code with fences stripped.
+
+        Every code-writing call goes through here, so with AI_CAD_DISK_CACHE=1
+        an identical request (pipeline coder and review included) is answered
+        from the disk cache.
+        """
+        cache = await self._cached_code_db()
+        if cache is None:
+            return _strip_code_fences(await self._stream_to_fence(model, messages))
+        key = _request_key(model, messages)
+        code = await cache.get(key)
+        if code is None:
+            code = _strip_code_fences(await self._stream_to_fence(model, messages))
+            if code:
+                await cache.put(key, code, _CODE_CACHE_TTL)
+        return code
+
+    async def _stream_to_fence(self, model: str, messages: list[dict]) -> str:
+        """Stream a completion, stopping once its first code block closes.
+
+        Whatever the model writes after the closing fence is thrown away, so
+        the stream is closed there instead of paying for the trailing prose.
+        """
+        async with self._slots:
+            await self._throttle(messages)
+            stream = await self._client.chat.completions.create(
+                model=model,
+                messages=messages,  # type: ignore[arg-type]
+                stream=True,
+                stream_options={"include_usage": True},
+                extra_body={"usage": {"include": True}},
+            )
+            parts: list[str] = []
+            try:
+                async for chunk in stream:
+                    if chunk.usage is not None:
+                        _log_usage(model, chunk.usage)
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content or ""
+                    parts.append(delta)
+                    if "`" in delta and _fence_closed("".join(parts)):
+                        break
+            finally:
+                await stream.close()
+        return "".join(parts)
+
     async def generate(
         self,
         prompt: str,
         image_base64: str | None = None,
         model: str | None = None,
         profile: str = "general",
+        include_reference: bool | None = None,
     ) -> str:
         """Generate build123d code from a text prompt (+ optional image).
 
+        The full API reference goes to large-context models only when the
+        prompt looks like it needs it; ``include_reference`` overrides that.
         Returns the raw Python code string (no fences).
         """
         use_model = model or self.default_model
-        use_reference = _model_has_large_context(use_model)
-        messages: list[dict] = [
-            {"role": "system", "content": _build_system_prompt(profile, include_reference=use_reference)}
-        ]
+        large_context = _model_has_large_context(use_model)
+        if include_reference is None:
+            include_reference = _prompt_wants_reference(prompt)
+        use_reference = large_context and include_reference
+        messages: list[dict] = [_system_message(
+            profile, include_reference=use_reference, compact=not large_context,
+        )]
 
         # Build user message (text or multimodal)
         if image_base64 and _model_supports_vision(use_model):
@@ -463,13 +714,29 @@ class LLMClient:
         else:
             messages.append({"role": "user", "content": prompt})
 
-        response = await self._client.chat.completions.create(
+        return await self._complete_code(
             model=use_model,
-            messages=messages,  # type: ignore[arg-type]
+            messages=messages,
         )
 
-        raw = response.choices[0].message.content or ""
-        return _strip_code_fences(raw)
+    async def generate_bytes(
+        self,
+        prompt: str,
+        image_bytes: bytes,
+        mime: str = "image/png",
+        model: str | None = None,
+        profile: str = "general",
+    ) -> str:
+        """Like ``generate`` but takes raw image bytes.
+
+        Base64 encoding runs in a worker thread so a large image does not
+        block the event loop. Non-vision models skip the encode entirely.
+        """
+        image_url = None
+        if _model_supports_vision(model or self.default_model):
+            b64 = await asyncio.to_thread(base64.b64encode, image_bytes)
+            image_url = f"data:{mime};base64,{b64.decode('ascii')}"
+        return await self.generate(prompt, image_url, model, profile=profile)
 
     async def generate_with_history(
         self,
@@ -485,17 +752,17 @@ class LLMClient:
         use_model = model or self.default_model
         use_reference = _model_has_large_context(use_model)
         full_messages = [
-            {"role": "system", "content": _build_system_prompt(profile, include_reference=use_reference)}
-        ] + messages
+            _system_message(
+                profile, include_reference=use_reference, compact=not use_reference,
+            ),
+            *messages,
+        ]
 
-        response = await self._client.chat.completions.create(
+        return await self._complete_code(
             model=use_model,
-            messages=full_messages,  # type: ignore[arg-type]
+            messages=full_messages,
         )
 
-        raw = response.choices[0].message.content or ""
-        return _strip_code_fences(raw)
-
     async def refine_code(
         self,
         current_code: str,
@@ -510,26 +777,25 @@ class LLMClient:
         """
         coder_model = PIPELINE_MODELS["coder"]
         use_reference = _model_has_large_context(coder_model)
-        system = _build_system_prompt(profile, include_reference=use_reference)
-
-        messages = list(history)
-        messages.append({
-            "role": "user",
-            "content": (
-                f"現在のコード:\n```python\n{current_code}\n```\n\n"
-                f"修正指示: {message}\n\n"
-                "修正後のコードのみを出力してください。"
-            ),
-        })
 
-        full_messages = [{"role": "system", "content": system}] + messages
+        # Built in one pass; the history dicts are shared, not copied
+        full_messages = [
+            _system_message(profile, include_reference=use_reference),
+            *history,
+            {
+                "role": "user",
+                "content": (
+                    f"現在のコード:\n```python\n{current_code}\n```\n\n"
+                    f"修正指示: {message}\n\n"
+                    "修正後のコードのみを出力してください。"
+                ),
+            },
+        ]
 
-        response = await self._client.chat.completions.create(
+        return await self._complete_code(
             model=coder_model,
-            messages=full_messages,  # type: ignore[arg-type]
+            messages=full_messages,
         )
-        raw = response.choices[0].message.content or ""
-        return _strip_code_fences(raw)
 
     async def generate_and_execute(
         self,
@@ -545,52 +811,145 @@ class LLMClient:
 
         Returns: (final_code, objects, step_bytes)
         Raises: CodeExecutionError after all retries exhausted
+
+        A plain text prompt that already succeeded is answered from the
+        client's result cache; history and image requests always generate.
         """
+        from nodes.ai_cad import CodeExecutionError, execute_build123d_code
+
+        cache_key = None
+        if not messages and not image_base64:
+            cache_key = (profile, model or self.default_model, _normalize_prompt(prompt))
+            hit = self._results.get(cache_key)
+            if hit is not None:
+                self._results.move_to_end(cache_key)
+                return hit
+
         retries = max_retries if max_retries is not None else self.max_retries
 
-        # Initial generation
-        if messages:
-            code = await self.generate_with_history(messages, model, profile=profile)
-        else:
-            code = await self.generate(prompt, image_base64, model, profile=profile)
+        def draft() -> Awaitable[str]:
+            if messages:
+                return self.generate_with_history(messages, model, profile=profile)
+            return self.generate(prompt, image_base64, model, profile=profile)
 
-        # Try execute + retry loop
+        # Initial generation. With speculative_k > 1, several drafts are
+        # requested at once and each is executed as it arrives; the first
+        # one that runs wins. A draft whose request fails is skipped. If
+        # none runs, the last failure counts as the first attempt, so the
+        # retries start from its error.
         last_error: CodeExecutionError | None = None
-        retry_messages = list(messages or [])
-        if not retry_messages:
-            retry_messages.append({"role": "user", "content": prompt})
-        retry_messages.append({"role": "assistant", "content": code})
+        if self.speculative_k > 1:
+            candidates = [
+                asyncio.create_task(draft()) for _ in range(self.speculative_k)
+            ]
+            code = None
+            draft_error: Exception | None = None
+            try:
+                for next_code in asyncio.as_completed(candidates):
+                    try:
+                        candidate = await next_code
+                    except Exception as e:
+                        draft_error = e
+                        continue
+                    try:
+                        objects, step_bytes = await asyncio.to_thread(
+                            execute_build123d_code, candidate
+                        )
+                    except CodeExecutionError as e:
+                        code, last_error = candidate, e
+                        continue
+                    return self._remember(cache_key, (candidate, objects, step_bytes))
+            finally:
+                for task in candidates:
+                    task.cancel()
+            if code is None:
+                raise draft_error  # type: ignore[misc]
+        else:
+            code = await draft()
+
+        # Try execute + retry loop. Each retry sends the original request plus
+        # only the latest attempt and its error, so the payload stays the same
+        # size however many retries run.
+        base_messages = messages or [{"role": "user", "content": prompt}]
 
         for attempt in range(1 + retries):
+            # With retry drafting on, draft the retry while this attempt
+            # executes. The draft cannot see the error, but it hides one
+            # round-trip.
+            retry_task = None
             try:
-                objects, step_bytes = execute_build123d_code(code)
-                return code, objects, step_bytes
-            except CodeExecutionError as e:
-                last_error = e
+                if last_error is None:
+                    if self.speculative_retry and attempt < retries:
+                        retry_task = asyncio.create_task(self.generate_with_history(
+                            [
+                                *base_messages,
+                                {"role": "assistant", "content": code},
+                                {
+                                    "role": "user",
+                                    "content": (
+                                        "Your code may fail to execute. Check it and "
+                                        "output only a corrected version."
+                                    ),
+                                },
+                            ],
+                            model, profile=profile,
+                        ))
+                    try:
+                        objects, step_bytes = await asyncio.to_thread(
+                            execute_build123d_code, code
+                        )
+                        return self._remember(cache_key, (code, objects, step_bytes))
+                    except CodeExecutionError as e:
+                        last_error = e
                 if attempt >= retries:
                     break
-                # Build retry feedback
-                retry_messages.append({
-                    "role": "user",
-                    "content": (
-                        f"Your code produced an error:\n{e}\n\n"
-                        f"Failed code:\n```python\n{code}\n```\n\n"
-                        f"Fix the code and output only the corrected version."
-                    ),
-                })
-                code = await self.generate_with_history(retry_messages, model, profile=profile)
-                retry_messages.append({"role": "assistant", "content": code})
+                if retry_task is not None:
+                    code = await retry_task
+                else:
+                    # The failed code is the assistant turn itself; don't repeat it
+                    retry_messages = [
+                        *base_messages,
+                        {"role": "assistant", "content": code},
+                        {
+                            "role": "user",
+                            "content": _RETRY_TEMPLATE.format(error=_error_text(last_error)),
+                        },
+                    ]
+                    code = await self.generate_with_history(
+                        retry_messages, model, profile=profile
+                    )
+                last_error = None
+            finally:
+                if retry_task is not None:
+                    if not retry_task.done():
+                        retry_task.cancel()
+                    elif not retry_task.cancelled():
+                        # An unused draft that failed must not be logged
+                        # as a never-retrieved task exception
+                        retry_task.exception()
 
         raise last_error  # type: ignore[misc]
 
+    def _remember(self, key: tuple | None, result: tuple) -> tuple:
+        """Store a successful result under ``key`` (if any), evicting the oldest."""
+        if key is not None:
+            self._results[key] = result
+            if len(self._results) > _RESULT_CACHE_SIZE:
+                self._results.popitem(last=False)
+        return result
+
     async def _design_with_context(
         self,
         prompt: str,
         profile: str = "general",
+        image_base64: str | None = None,
     ) -> str:
-        """Stage 1: Use Gemini to analyze prompt and extract relevant API/examples."""
+        """Stage 1: Use Gemini to analyze prompt and extract relevant API/examples.
+
+        An image (data URL) is attached here only; later stages work from the
+        design text, so the image is sent once per pipeline run.
+        """
         designer_model = PIPELINE_MODELS["designer"]
-        reference_content = _build_system_prompt(profile, include_reference=True)
 
         design_prompt = (
             "以下のユーザー要求を分析し、build123dで実装するための設計を出力してください。\n\n"
@@ -602,11 +961,18 @@ class LLMClient:
             "4. RELEVANT_EXAMPLES: 参考になるコード例\n"
         )
 
-        response = await self._client.chat.completions.create(
+        user_content: str | list[dict] = design_prompt
+        if image_base64 and _model_supports_vision(designer_model):
+            user_content = [
+                {"type": "text", "text": design_prompt},
+                {"type": "image_url", "image_url": {"url": image_base64}},
+            ]
+
+        response = await self._complete(
             model=designer_model,
             messages=[
-                {"role": "system", "content": reference_content},
-                {"role": "user", "content": design_prompt},
+                _system_message(profile, include_reference=True),
+                {"role": "user", "content": user_content},
             ],
         )
         return response.choices[0].message.content or ""
@@ -617,25 +983,67 @@ class LLMClient:
         design: str,
         profile: str = "general",
     ) -> str:
-        """Stage 2: Use Qwen3 Coder to generate build123d code from design."""
+        """Stage 2: Use Qwen3 Coder to generate build123d code from design.
+
+        An empty ``design`` asks for code straight from the request.
+        """
         coder_model = PIPELINE_MODELS["coder"]
-        system = _build_system_prompt(profile, include_reference=False)
+        # Same system message as review/refine so the coder's cached prefix is shared
+        use_reference = _model_has_large_context(coder_model)
+
+        if design:
+            user_content = (
+                f"ユーザー要求: {prompt}\n\n"
+                f"設計:\n{design}\n\n"
+                "上記の設計に基づいてbuild123dコードを生成してください。"
+            )
+        else:
+            user_content = (
+                f"ユーザー要求: {prompt}\n\n"
+                "build123dコードを生成してください。"
+            )
+
+        return await self._complete_code(
+            model=coder_model,
+            messages=[
+                _system_message(profile, include_reference=use_reference),
+                {"role": "user", "content": user_content},
+            ],
+        )
+
+    async def _design_and_code(
+        self,
+        prompt: str,
+        profile: str = "general",
+    ) -> tuple[str, str]:
+        """Stages 1+2 in one coder call: a short design, then the code.
+
+        Returns (design, code).
+        """
+        coder_model = PIPELINE_MODELS["coder"]
+        use_reference = _model_has_large_context(coder_model)
 
         user_content = (
             f"ユーザー要求: {prompt}\n\n"
-            f"設計:\n{design}\n\n"
-            "上記の設計に基づいてbuild123dコードを生成してください。"
+            "まず<design>…</design>の中に簡潔な設計（パーツ構成、寸法、手法）を書き、"
+            "その後にbuild123dコードを```pythonブロックで出力してください。"
+            "それ以外は出力しないでください。"
         )
 
-        response = await self._client.chat.completions.create(
-            model=coder_model,
-            messages=[
-                {"role": "system", "content": system},
+        raw = await self._stream_to_fence(
+            coder_model,
+            [
+                _system_message(profile, include_reference=use_reference),
                 {"role": "user", "content": user_content},
             ],
         )
-        raw = response.choices[0].message.content or ""
-        return _strip_code_fences(raw)
+        design = ""
+        start = raw.find("<design>")
+        end = raw.find("</design>", start)
+        if start >= 0 and end >= 0:
+            design = raw[start + len("<design>"):end].strip()
+            raw = raw[end + len("</design>"):]
+        return design, _strip_code_fences(raw)
 
     async def _self_review(
         self,
@@ -646,7 +1054,6 @@ class LLMClient:
         """Stage 2.5: Self-review generated code before execution."""
         coder_model = PIPELINE_MODELS["coder"]
         use_reference = _model_has_large_context(coder_model)
-        system = _build_system_prompt(profile, include_reference=use_reference)
 
         review_content = (
             "以下のコードをレビューしてください:\n"
@@ -658,15 +1065,13 @@ class LLMClient:
             f"コード:\n```python\n{code}\n```"
         )
 
-        response = await self._client.chat.completions.create(
+        return await self._complete_code(
             model=coder_model,
             messages=[
-                {"role": "system", "content": system},
+                _system_message(profile, include_reference=use_reference),
                 {"role": "user", "content": review_content},
             ],
         )
-        raw = response.choices[0].message.content or ""
-        return _strip_code_fences(raw)
 
     async def generate_pipeline(
         self,
@@ -677,8 +1082,14 @@ class LLMClient:
         coder_model: str | None = None,
         on_stage: Callable[[str], Awaitable[None]] | None = None,
         on_detail: Callable[[str, str], Awaitable[None]] | None = None,
+        fused: bool = False,
     ) -> tuple[str, list[BrepObject], bytes | None]:
-        """Run 2-stage pipeline: Gemini design → Qwen code → review → execute → retry."""
+        """Run 2-stage pipeline: Gemini design → Qwen code → review → execute → retry.
+
+        With ``fused`` the coder writes the design and the code in one call
+        and the review is skipped, saving two round-trips on simple prompts.
+        """
+        from nodes.ai_cad import CodeExecutionError, execute_build123d_code
 
         async def _notify(stage: str):
             if on_stage:
@@ -688,29 +1099,63 @@ class LLMClient:
             if on_detail:
                 await on_detail(key, value)
 
-        # Stage 1: Design with Gemini
-        await _notify("designing")
-        design = await self._design_with_context(prompt, profile=profile)
-        await _detail("design", design)
-
-        # Stage 2: Generate code with Qwen
-        await _notify("coding")
-        code = await self._generate_code(prompt, design, profile=profile)
-        await _detail("code", code)
-
-        # Stage 2.5: Self-review
-        await _notify("reviewing")
-        code = await self._self_review(prompt, code, profile=profile)
-        await _detail("reviewed_code", code)
+        # The coder cannot see images, so an image forces the design stage
+        if fused and not image_base64:
+            await _notify("coding")
+            design, code = await self._design_and_code(prompt, profile=profile)
+            await _detail("design", design)
+            await _detail("code", code)
+        else:
+            # Stage 1: Design with Gemini
+            await _notify("designing")
+            design_task = asyncio.create_task(
+                self._design_with_context(
+                    prompt, profile=profile, image_base64=image_base64,
+                )
+            )
+            try:
+                if self.speculative and not image_base64:
+                    # Fast path: code without a design while the designer runs.
+                    # If it executes, the design round-trip is skipped entirely.
+                    # Any failure here, API or execution, falls back to the
+                    # design path it is racing.
+                    try:
+                        fast_code = await self._generate_code(prompt, "", profile=profile)
+                        objects, step_bytes = await asyncio.to_thread(
+                            execute_build123d_code, fast_code
+                        )
+                    except Exception:
+                        pass
+                    else:
+                        await _notify("coding")
+                        await _detail("code", fast_code)
+                        return fast_code, objects, step_bytes
+                design = await design_task
+            finally:
+                if not design_task.done():
+                    design_task.cancel()
+            await _detail("design", design)
+
+            # Stage 2: Generate code with Qwen
+            await _notify("coding")
+            code = await self._generate_code(prompt, design, profile=profile)
+            await _detail("code", code)
+
+            # Stage 2.5: Self-review
+            await _notify("reviewing")
+            code = await self._self_review(prompt, code, profile=profile)
+            await _detail("reviewed_code", code)
 
         # Execute
         await _notify("executing")
-        first_error: CodeExecutionError | None = None
+        first_error = ""
         try:
-            objects, step_bytes = execute_build123d_code(code)
+            objects, step_bytes = await asyncio.to_thread(
+                execute_build123d_code, code
+            )
             return code, objects, step_bytes
         except CodeExecutionError as e:
-            first_error = e
+            first_error = _error_text(e)
             await _detail("execution_error", str(e))
 
         # Retry: re-query Gemini with error info, then Qwen
@@ -731,7 +1176,9 @@ class LLMClient:
         await _detail("retry_code", retry_code)
 
         await _notify("executing")
-        objects, step_bytes = execute_build123d_code(retry_code)
+        objects, step_bytes = await asyncio.to_thread(
+            execute_build123d_code, retry_code
+        )
         return retry_code, objects, step_bytes
 
     def list_profiles_info(self) -> list[dict]:
@@ -743,32 +1190,103 @@ class LLMClient:
 
     def list_models(self) -> list[dict]:
         """Return available models with metadata."""
-        return [
-            {
-                "id": mid,
-                "name": info["name"],
-                "is_default": mid == self.default_model,
-                "supports_vision": info["supports_vision"],
-                "large_context": info.get("large_context", False),
-            }
-            for mid, info in AVAILABLE_MODELS.items()
-        ]
+        return list(_models_info(self.default_model))
+
+
+@functools.cache
+def _models_info(default_model: str) -> tuple[dict, ...]:
+    """Model metadata for ``list_models``; AVAILABLE_MODELS is static."""
+    return tuple(
+        {
+            "id": mid,
+            "name": info["name"],
+            "is_default": mid == default_model,
+            "supports_vision": info["supports_vision"],
+            "large_context": info.get("large_context", False),
+        }
+        for mid, info in AVAILABLE_MODELS.items()
+    )
 
 
 def _model_supports_vision(model_id: str) -> bool:
-    info = AVAILABLE_MODELS.get(model_id)
-    return bool(info and info.get("supports_vision"))
+    return model_id in _VISION_MODELS
 
 
 def _model_has_large_context(model_id: str) -> bool:
-    info = AVAILABLE_MODELS.get(model_id)
-    return bool(info and info.get("large_context"))
+    return model_id in _LARGE_CONTEXT_MODELS
+
+
+def _log_usage(model: str, usage) -> None:
+    """Debug-log prompt tokens and how many of them were served from cache."""
+    details = getattr(usage, "prompt_tokens_details", None)
+    if details is not None:
+        logger.debug(
+            "%s: %s prompt tokens, %s cached",
+            model, getattr(usage, "prompt_tokens", None),
+            getattr(details, "cached_tokens", None),
+        )
+
+
+def _estimate_tokens(messages: list[dict]) -> int:
+    """Rough prompt size (4 characters per token) for rate limiting."""
+    chars = 0
+    for msg in messages:
+        content = msg["content"]
+        if isinstance(content, str):
+            chars += len(content)
+        else:
+            chars += sum(len(part.get("text", "")) for part in content)
+    return chars // 4
+
+
+def _prompt_wants_reference(prompt: str) -> bool:
+    """Whether a prompt is complex enough to justify the full API reference."""
+    if len(prompt) > _REFERENCE_PROMPT_CHARS:
+        return True
+    lowered = prompt.casefold()
+    return any(word in lowered for word in _REFERENCE_KEYWORDS)
+
+
+def _request_key(model: str, messages: list[dict]) -> str:
+    """Stable hash of a completion request, for the disk code cache."""
+    payload = json.dumps([model, messages], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _normalize_prompt(prompt: str) -> str:
+    """Case- and whitespace-insensitive form of a prompt, for cache keys."""
+    return " ".join(prompt.casefold().split())
+
+
+def _error_text(error: Exception) -> str:
+    """The error message, trimmed to its tail if it is very long."""
+    text = str(error)
+    if len(text) <= _MAX_ERROR_CHARS:
+        return text
+    # The last lines of a traceback name the actual failure
+    return "…" + text[-_MAX_ERROR_CHARS:]
+
+
+def _fence_closed(text: str) -> bool:
+    """True once ``text`` contains an opening and a closing code fence."""
+    start = text.find("```")
+    return start >= 0 and text.find("```", start + 3) >= 0
 
 
 def _strip_code_fences(text: str) -> str:
-    """Remove markdown code fences if present."""
-    match = _CODE_FENCE_RE.search(text)
-    if match:
-        return match.group(1).strip()
-    return text.strip()
+    """Remove markdown code fences if present.
+
+    Returns the body of the first fenced block (an optional ``python`` tag
+    after the opening fence is dropped), or the whole text if there is none.
+    """
+    start = text.find("```")
+    if start < 0:
+        return text.strip()
+    start += 3
+    if text.startswith("python", start):
+        start += 6
+    end = text.find("```", start)
+    if end < 0:
+        return text.strip()
+    return text[start:end].strip()
 
@@ -1,28 +1,41 @@
 import asyncio
-import io
+import functools
 import json
+import math
+import os
+import shutil
 import uuid
 import zipfile
 from pathlib import Path
+from tempfile import SpooledTemporaryFile
 
 from dotenv import load_dotenv
 
 load_dotenv(Path(__file__).parent.parent / ".env")
 
+import numpy as np
 import yaml
-from fastapi import FastAPI, HTTPException, UploadFile
+from build123d import Compound
+from build123d import export_step as bd_export_step
+from fastapi import FastAPI, HTTPException, Query, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import Response, StreamingResponse
+from pydantic import TypeAdapter
+import shapely
+from shapely.geometry import Polygon, box as shapely_box
+from shapely.strtree import STRtree
 
 from nodes.align import align_solids
-from nodes.brep_import import analyze_step_file, _analyze_solid
+from nodes.brep_import import analyze_step_file, load_step_solids, _analyze_solid
 from nodes.contour_extract import extract_contours
-from nodes.mesh_export import tessellate_step_file
+from nodes.mesh_export import export_step_to_stl, tessellate_step_file
 from nodes.mesh_import import analyze_mesh_file
+from nodes.nesting import auto_nesting
 from nodes.operation_detector import detect_operations
+from nodes.three_d_milling import generate_raster_finishing, generate_waterline_roughing
 from nodes.toolpath_gen import generate_toolpath, generate_toolpath_from_operations
 from nodes.ai_cad import execute_build123d_code, CodeExecutionError
-from llm_client import LLMClient
+from llm_client import AVAILABLE_MODELS, PIPELINE_MODELS, LLMClient
 from db import GenerationDB, SnippetsDB
 from sbp_writer import SbpWriter
 from schemas import (
@@ -32,7 +45,7 @@ from schemas import (
     SbpGenRequest, OutputResult,
     DetectOperationsRequest, OperationDetectResult,
     SheetSettings, SheetMaterial, BoundingBox,
-    MeshDataRequest, MeshDataResult, ObjectMesh,
+    MeshDataRequest, MeshDataResult,
     PlacementItem, ValidatePlacementRequest, ValidatePlacementResponse,
     AutoNestingRequest, AutoNestingResponse,
     SbpZipRequest,
@@ -60,6 +73,17 @@ UPLOAD_DIR = Path(__file__).parent / "uploads"
 UPLOAD_DIR.mkdir(exist_ok=True)
 PRESETS_DIR = Path(__file__).parent / "presets"
 
+# SBP zip downloads: in-memory up to this size, then spooled to a temp file
+_ZIP_SPOOL_BYTES = 16 * 1024 * 1024
+_ZIP_CHUNK_BYTES = 64 * 1024
+_UPLOAD_CHUNK_BYTES = 1024 * 1024
+
+# /api/presets body, keyed by the YAML file's mtime so edits are picked up
+_presets_cache: tuple[int, bytes] | None = None
+_PRESET_LIST = TypeAdapter(list[PresetItem])
+# libyaml's loader when available; the pure-Python one is much slower
+_YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
 DATA_DIR = Path(__file__).parent / "data"
 DATA_DIR.mkdir(exist_ok=True)
 GENERATIONS_DIR = DATA_DIR / "generations"
@@ -99,14 +123,72 @@ async def shutdown():
         await _db.close()
     if _snippets_db is not None:
         await _snippets_db.close()
+    if _llm is not None:
+        await _llm.close()
+
+
+def _parse_page_cursor(cursor: str | None) -> tuple[str, str] | None:
+    """Split a ``<created_at>,<id>`` page cursor, or raise 400."""
+    if not cursor:
+        return None
+    created_at, sep, row_id = cursor.rpartition(",")
+    if not sep or not created_at or not row_id:
+        raise HTTPException(status_code=400, detail=f"Invalid cursor: {cursor}")
+    return created_at, row_id
+
+
+# file_id -> saved upload, filled as files are written so lookups skip the
+# directory scan. Files from before a restart are found by glob on first use.
+_UPLOAD_INDEX: dict[str, Path] = {}
+
+
+async def _save_upload(file: UploadFile, path: Path) -> None:
+    """Copy an uploaded file to ``path`` in chunks, off the event loop."""
+    def copy():
+        with path.open("wb") as out:
+            shutil.copyfileobj(file.file, out, _UPLOAD_CHUNK_BYTES)
+
+    await asyncio.to_thread(copy)
+
+
+def _save_generation_step(file_id: str, step_bytes: bytes) -> Path:
+    """Write generated STEP bytes once and expose them as an upload too.
+
+    The copy under GENERATIONS_DIR is the real file; the uploads entry is a
+    hard link to it (a second write only if linking is not possible).
+    """
+    gen_dir = GENERATIONS_DIR / file_id
+    gen_dir.mkdir(exist_ok=True)
+    step_file = gen_dir / "model.step"
+    step_file.write_bytes(step_bytes)
+
+    upload_path = UPLOAD_DIR / f"{file_id}.step"
+    try:
+        os.link(step_file, upload_path)
+    except OSError:
+        upload_path.write_bytes(step_bytes)
+    _UPLOAD_INDEX[file_id] = upload_path
+    return step_file
 
 
 def _get_uploaded_step_path(file_id: str) -> Path:
     """Resolve a file_id to its uploaded STEP file path, or raise 404."""
-    matches = list(UPLOAD_DIR.glob(f"{file_id}.*"))
-    if not matches:
-        raise HTTPException(status_code=404, detail=f"File not found: {file_id}")
-    return matches[0]
+    path = _UPLOAD_INDEX.get(file_id)
+    if path is None:
+        # Saved names are <file_id><suffix>; try the STEP ones with a stat
+        # each before scanning the directory for anything else
+        for suffix in (".step", ".stp"):
+            candidate = UPLOAD_DIR / f"{file_id}{suffix}"
+            if candidate.is_file():
+                path = candidate
+                break
+        else:
+            matches = list(UPLOAD_DIR.glob(f"{file_id}.*"))
+            if not matches:
+                raise HTTPException(status_code=404, detail=f"File not found: {file_id}")
+            path = matches[0]
+        _UPLOAD_INDEX[file_id] = path
+    return path
 
 
 def _resolve_stl_for_file_id(file_id: str) -> Path:
@@ -115,7 +197,6 @@ def _resolve_stl_for_file_id(file_id: str) -> Path:
     if stl_path.exists():
         return stl_path
     step_path = _get_uploaded_step_path(file_id)
-    from nodes.mesh_export import export_step_to_stl
     result = export_step_to_stl(step_path, output_dir=UPLOAD_DIR)
     if result.name != f"{file_id}.stl":
         result.rename(stl_path)
@@ -140,11 +221,12 @@ async def upload_step(file: UploadFile):
     file_id = uuid.uuid4().hex[:12]
     saved_path = UPLOAD_DIR / f"{file_id}{suffix}"
 
-    content = await file.read()
-    saved_path.write_bytes(content)
+    await _save_upload(file, saved_path)
 
     try:
-        objects = analyze_step_file(saved_path, file_name=file.filename)
+        objects = await asyncio.to_thread(
+            analyze_step_file, saved_path, file_name=file.filename
+        )
     except ValueError as e:
         saved_path.unlink(missing_ok=True)
         raise HTTPException(status_code=422, detail=str(e))
@@ -152,6 +234,7 @@ async def upload_step(file: UploadFile):
         saved_path.unlink(missing_ok=True)
         raise HTTPException(status_code=500, detail=f"STEP analysis failed: {e}")
 
+    _UPLOAD_INDEX[file_id] = saved_path
     return BrepImportResult(
         file_id=file_id,
         objects=objects,
@@ -174,11 +257,12 @@ async def upload_mesh(file: UploadFile):
     file_id = uuid.uuid4().hex[:12]
     saved_path = UPLOAD_DIR / f"{file_id}{suffix}"
 
-    content = await file.read()
-    saved_path.write_bytes(content)
+    await _save_upload(file, saved_path)
 
     try:
-        objects = analyze_mesh_file(saved_path, file_name=file.filename)
+        objects = await asyncio.to_thread(
+            analyze_mesh_file, saved_path, file_name=file.filename
+        )
     except ValueError as e:
         saved_path.unlink(missing_ok=True)
         raise HTTPException(status_code=422, detail=str(e))
@@ -186,6 +270,7 @@ async def upload_mesh(file: UploadFile):
         saved_path.unlink(missing_ok=True)
         raise HTTPException(status_code=500, detail=f"Mesh analysis failed: {e}")
 
+    _UPLOAD_INDEX[file_id] = saved_path
     return MeshImportResult(
         file_id=file_id,
         objects=objects,
@@ -195,16 +280,16 @@ async def upload_mesh(file: UploadFile):
 
 
 @app.post("/api/align-parts", response_model=BrepImportResult)
-def align_parts_endpoint(req: AlignPartsRequest):
+async def align_parts_endpoint(req: AlignPartsRequest):
     """Rotate assembled parts flat for CNC and re-analyze."""
-    from build123d import import_step, Compound
-    from build123d import export_step as bd_export_step
-
     step_path = _get_uploaded_step_path(req.file_id)
+    return await asyncio.to_thread(_align_parts, step_path)
 
+
+def _align_parts(step_path: Path) -> BrepImportResult:
+    """Align the solids in a STEP file, save them as a new upload and re-analyze."""
     try:
-        compound = import_step(str(step_path))
-        solids = list(compound.solids())
+        solids = load_step_solids(step_path)
         if not solids:
             raise HTTPException(status_code=422, detail="No solids found")
 
@@ -215,6 +300,7 @@ def align_parts_endpoint(req: AlignPartsRequest):
         new_file_id = uuid.uuid4().hex[:12]
         new_path = UPLOAD_DIR / f"{new_file_id}.step"
         bd_export_step(new_compound, str(new_path))
+        _UPLOAD_INDEX[new_file_id] = new_path
 
         # Re-analyze each aligned solid
         objects = [
@@ -236,9 +322,6 @@ def align_parts_endpoint(req: AlignPartsRequest):
 @app.post("/api/merge-breps", response_model=BrepImportResult)
 def merge_breps_endpoint(req: MergeBRepsRequest):
     """Merge multiple STEP files into one combined file."""
-    from build123d import import_step, Compound
-    from build123d import export_step as bd_export_step
-
     if len(req.file_ids) < 2:
         raise HTTPException(status_code=400, detail="At least 2 file_ids required")
 
@@ -246,9 +329,7 @@ def merge_breps_endpoint(req: MergeBRepsRequest):
     all_file_names = []
     for fid in req.file_ids:
         step_path = _get_uploaded_step_path(fid)
-        compound = import_step(str(step_path))
-        solids = list(compound.solids())
-        all_solids.extend(solids)
+        all_solids.extend(load_step_solids(step_path))
         all_file_names.append(step_path.stem)
 
     if not all_solids:
@@ -258,6 +339,7 @@ def merge_breps_endpoint(req: MergeBRepsRequest):
     new_file_id = uuid.uuid4().hex[:12]
     new_path = UPLOAD_DIR / f"{new_file_id}.step"
     bd_export_step(merged_compound, str(new_path))
+    _UPLOAD_INDEX[new_file_id] = new_path
 
     objects = [
         _analyze_solid(s, index=i, file_name="merged.step")
@@ -277,7 +359,8 @@ async def extract_contours_endpoint(req: ContourExtractRequest):
     step_path = _get_uploaded_step_path(req.file_id)
 
     try:
-        result = extract_contours(
+        result = await asyncio.to_thread(
+            extract_contours,
             step_path=step_path,
             object_id=req.object_id,
             tool_diameter=req.tool_diameter,
@@ -318,10 +401,21 @@ def validate_settings(req: ValidateSettingsRequest):
 @app.get("/api/presets", response_model=list[PresetItem])
 def get_presets():
     """Return available machining presets."""
+    global _presets_cache
     yaml_path = PRESETS_DIR / "materials.yaml"
-    if not yaml_path.exists():
+    try:
+        mtime = yaml_path.stat().st_mtime_ns
+    except FileNotFoundError:
         return []
-    data = yaml.safe_load(yaml_path.read_text())
+    if _presets_cache is None or _presets_cache[0] != mtime:
+        _presets_cache = (mtime, _presets_json(yaml_path))
+    # Serialized once per file version, so hits skip Pydantic entirely
+    return Response(content=_presets_cache[1], media_type="application/json")
+
+
+def _presets_json(yaml_path: Path) -> bytes:
+    """Parse the presets file into the /api/presets JSON body."""
+    data = yaml.load(yaml_path.read_text(), Loader=_YamlLoader)
     result = []
     for p in data.get("presets", []):
         preset_id = p["id"]
@@ -334,16 +428,17 @@ def get_presets():
             material=material,
             settings=MachiningSettings(**settings_fields),
         ))
-    return result
+    return _PRESET_LIST.dump_json(result)
 
 
 @app.post("/api/detect-operations", response_model=OperationDetectResult)
-def detect_operations_endpoint(req: DetectOperationsRequest):
+async def detect_operations_endpoint(req: DetectOperationsRequest):
     """Detect machining operations from uploaded STEP file."""
     step_path = _get_uploaded_step_path(req.file_id)
 
     try:
-        result = detect_operations(
+        result = await asyncio.to_thread(
+            detect_operations,
             step_path=step_path,
             file_id=req.file_id,
             object_ids=req.object_ids,
@@ -359,10 +454,11 @@ def detect_operations_endpoint(req: DetectOperationsRequest):
 
 
 @app.post("/api/generate-toolpath", response_model=ToolpathGenResult)
-def generate_toolpath_endpoint(req: ToolpathGenRequest):
+async def generate_toolpath_endpoint(req: ToolpathGenRequest):
     """Generate toolpath passes from operation assignments."""
     try:
-        result = generate_toolpath_from_operations(
+        result = await asyncio.to_thread(
+            generate_toolpath_from_operations,
             req.operations, req.detected_operations, req.sheet,
             req.placements, req.object_origins, req.bounding_boxes
         )
@@ -398,35 +494,40 @@ def generate_sbp_endpoint(req: SbpGenRequest):
 
 
 @app.post("/api/mesh-data", response_model=MeshDataResult)
-def mesh_data_endpoint(req: MeshDataRequest):
+async def mesh_data_endpoint(req: MeshDataRequest):
     """Return tessellated mesh data for 3D preview."""
     step_path = _get_uploaded_step_path(req.file_id)
 
     try:
-        raw_meshes = tessellate_step_file(step_path)
+        body = await asyncio.to_thread(_mesh_data_json, step_path)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Tessellation failed: {e}")
 
-    objects = [ObjectMesh(**m) for m in raw_meshes]
-    return MeshDataResult(objects=objects)
+    return Response(content=body, media_type="application/json")
+
+
+def _mesh_data_json(step_path: Path) -> bytes:
+    """Tessellate and serialize in one pass; the float lists are dumped by
+    pydantic-core instead of going through jsonable_encoder and json.dumps."""
+    raw_meshes = tessellate_step_file(step_path)
+    return MeshDataResult(objects=raw_meshes).model_dump_json().encode()
 
 
 @app.post("/api/auto-nesting", response_model=AutoNestingResponse)
 def auto_nesting_endpoint(req: AutoNestingRequest):
     """Run BLF auto-nesting to distribute parts across sheets."""
-    from nodes.nesting import auto_nesting
-
     placements = auto_nesting(
         req.objects, req.sheet, req.tool_diameter, req.clearance,
     )
     sheet_ids = set(p.sheet_id for p in placements)
     # Warn about parts that don't fit
     warnings = []
+    objs_by_id = {o.object_id: o for o in req.objects}
+    tmpl = req.sheet.materials[0] if req.sheet.materials else None
     for p in placements:
-        obj = next((o for o in req.objects if o.object_id == p.object_id), None)
+        obj = objs_by_id.get(p.object_id)
         if obj and p.x_offset == 0 and p.y_offset == 0 and p.rotation == 0:
             bb = obj.bounding_box
-            tmpl = req.sheet.materials[0] if req.sheet.materials else None
             if tmpl and (bb.x > tmpl.width or bb.y > tmpl.depth):
                 warnings.append(f"{p.object_id}: シートに収まりません")
     return AutoNestingResponse(
@@ -460,61 +561,147 @@ def _validate_placement(
     return warnings
 
 
+def _out_of_bounds_mask(
+    checked: list[tuple[PlacementItem, SheetMaterial, BoundingBox]],
+) -> np.ndarray:
+    """Vectorised form of the _validate_placement tests: True where any fails."""
+    if not checked:
+        return np.zeros(0, dtype=bool)
+    # Columns: x_offset, y_offset, bb.x, bb.y, sheet width, sheet depth
+    a = np.array(
+        [(p.x_offset, p.y_offset, bb.x, bb.y, m.width, m.depth) for p, m, bb in checked],
+        dtype=np.float64,
+    )
+    xo, yo, bx, by, w, d = a.T
+    return (xo + bx > w) | (yo + by > d) | (xo < 0) | (yo < 0)
+
+
+def _placement_matrix(p: PlacementItem, bb: BoundingBox) -> list[float]:
+    """Affine matrix: rotate around the BB center, then move to the offset."""
+    if not p.rotation:
+        return [1.0, 0.0, 0.0, 1.0, p.x_offset, p.y_offset]
+    theta = math.radians(p.rotation)
+    cos_t, sin_t = math.cos(theta), math.sin(theta)
+    cx, cy = bb.x / 2, bb.y / 2
+    tx = p.x_offset + cx - cx * cos_t + cy * sin_t
+    ty = p.y_offset + cy - cx * sin_t - cy * cos_t
+    return [cos_t, -sin_t, sin_t, cos_t, tx, ty]
+
+
+def _box_collisions(
+    items: list[tuple[PlacementItem, BoundingBox]],
+) -> list[tuple[int, int]]:
+    """Overlapping pairs (i < j) of unbuffered BB rectangles at right angles."""
+    rows = []
+    for p, bb in items:
+        if p.rotation in (90, 270):
+            # Rotated around the BB center: same center, swapped extents
+            cx, cy = p.x_offset + bb.x / 2, p.y_offset + bb.y / 2
+            rows.append((cx - bb.y / 2, cy - bb.x / 2, cx + bb.y / 2, cy + bb.x / 2))
+        else:
+            rows.append((p.x_offset, p.y_offset, p.x_offset + bb.x, p.y_offset + bb.y))
+    b = np.array(rows)
+    # Touching counts as a collision, as with Shapely's intersects
+    hit = (
+        (b[:, None, 0] <= b[None, :, 2]) & (b[:, None, 2] >= b[None, :, 0])
+        & (b[:, None, 1] <= b[None, :, 3]) & (b[:, None, 3] >= b[None, :, 1])
+    )
+    return [(i, j) for i, j in np.argwhere(np.triu(hit, 1)).tolist()]
+
+
+def _place_all(bases: np.ndarray, matrices: np.ndarray) -> np.ndarray:
+    """Apply one affine matrix per geometry, transforming all vertices at once."""
+    coords, index = shapely.get_coordinates(bases, return_index=True)
+    m = matrices[index]
+    x, y = coords[:, 0], coords[:, 1]
+    moved = np.column_stack((
+        m[:, 0] * x + m[:, 1] * y + m[:, 4],
+        m[:, 2] * x + m[:, 3] * y + m[:, 5],
+    ))
+    # set_coordinates swaps new geometries into the array; the cached bases
+    # it held are left untouched
+    return shapely.set_coordinates(bases, moved)
+
+
+def _polygon_collisions(
+    items: list[tuple[PlacementItem, BoundingBox]],
+    req: ValidatePlacementRequest,
+    base_polys: dict[str, Polygon],
+) -> list[tuple[int, int]]:
+    """Overlapping pairs (i < j) of placed outlines, including the tool margin."""
+    bases = []
+    for p, bb in items:
+        # The tool margin is buffered once per object (a buffer commutes with
+        # rotation and translation), then rotate-around-BB-center + translate
+        # is one affine transform.
+        poly = base_polys.get(p.object_id)
+        if poly is None:
+            outline = req.outlines.get(p.object_id, [])
+            if len(outline) >= 3:
+                poly = Polygon(outline)
+            else:
+                poly = shapely_box(0, 0, bb.x, bb.y)
+
+            # Tool diameter margin
+            if req.tool_diameter > 0:
+                poly = poly.buffer(req.tool_diameter / 2)
+            base_polys[p.object_id] = poly
+        bases.append(poly)
+    polys = _place_all(
+        np.array(bases, dtype=object),
+        np.array([_placement_matrix(p, bb) for p, bb in items]),
+    )
+
+    # Bulk spatial-index query: one GEOS call for every candidate pair
+    src, dst = STRtree(polys).query(polys, predicate="intersects")
+    return sorted((i, j) for i, j in zip(src.tolist(), dst.tolist()) if i < j)
+
+
 @app.post("/api/validate-placement", response_model=ValidatePlacementResponse)
 def validate_placement_endpoint(req: ValidatePlacementRequest):
     """Validate part placements on sheet (bounds + collision)."""
-    from shapely.geometry import Polygon, box as shapely_box
-    from shapely.affinity import translate
-    from nodes.geometry_utils import rotate_polygon
-
     mat_lookup = {m.material_id: m for m in req.sheet.materials}
     all_warnings: list[str] = []
 
-    # 1. Bounds check per part
+    # 1. Bounds check per part: flag violations in bulk, format only those
+    checked = []
     for p in req.placements:
         sheet_mat = mat_lookup.get(p.material_id)
         bb = req.bounding_boxes.get(p.object_id)
         if sheet_mat and bb:
-            all_warnings.extend(_validate_placement(p, sheet_mat, bb))
+            checked.append((p, sheet_mat, bb))
+    for i in np.flatnonzero(_out_of_bounds_mask(checked)):
+        all_warnings.extend(_validate_placement(*checked[i]))
 
     # 2. Collision check between pairs on the same sheet
     if len(req.placements) >= 2:
-        # Build polygon per placement
-        placement_polys: list[tuple[PlacementItem, Polygon]] = []
-        for p in req.placements:
-            bb = req.bounding_boxes.get(p.object_id)
-            if not bb:
-                continue
-            outline = req.outlines.get(p.object_id, [])
-            if len(outline) >= 3:
-                poly = Polygon(outline)
-            else:
-                poly = shapely_box(0, 0, bb.x, bb.y)
-
-            # Rotate around BB center
-            if p.rotation:
-                cx, cy = bb.x / 2, bb.y / 2
-                poly = rotate_polygon(poly, p.rotation, (cx, cy))
-
-            # Tool diameter margin
-            if req.tool_diameter > 0:
-                poly = poly.buffer(req.tool_diameter / 2)
-
-            # Translate to placement position
-            poly = translate(poly, p.x_offset, p.y_offset)
-            placement_polys.append((p, poly))
+        sized = [
+            (p, bb) for p in req.placements
+            if (bb := req.bounding_boxes.get(p.object_id))
+        ]
+        # Without outlines or a tool margin, and at right angles, every part
+        # stays an axis-aligned rectangle and GEOS is not needed
+        boxes_only = req.tool_diameter <= 0 and not any(
+            p.rotation % 90 or len(req.outlines.get(p.object_id, [])) >= 3
+            for p, _ in sized
+        )
 
         # Group by sheet_id and check collisions within each group
-        from itertools import groupby
-        sorted_by_sheet = sorted(placement_polys, key=lambda x: x[0].sheet_id)
-        for _sheet_id, group in groupby(sorted_by_sheet, key=lambda x: x[0].sheet_id):
-            items = list(group)
-            for i in range(len(items)):
-                for j in range(i + 1, len(items)):
-                    if items[i][1].intersects(items[j][1]):
-                        all_warnings.append(
-                            f"衝突: {items[i][0].object_id} と {items[j][0].object_id} が重なっています"
-                        )
+        sheet_items: dict[str, list[tuple[PlacementItem, BoundingBox]]] = {}
+        for item in sized:
+            sheet_items.setdefault(item[0].sheet_id, []).append(item)
+        base_polys: dict[str, Polygon] = {}
+        for items in sheet_items.values():
+            if len(items) < 2:
+                continue
+            if boxes_only:
+                pairs = _box_collisions(items)
+            else:
+                pairs = _polygon_collisions(items, req, base_polys)
+            for i, j in pairs:
+                all_warnings.append(
+                    f"衝突: {items[i][0].object_id} と {items[j][0].object_id} が重なっています"
+                )
 
     return ValidatePlacementResponse(
         valid=len(all_warnings) == 0,
@@ -522,48 +709,67 @@ def validate_placement_endpoint(req: ValidatePlacementRequest):
     )
 
 
+def _generate_sheet_sbp(
+    req: SbpZipRequest,
+    sheet_placements: list[PlacementItem],
+    sheet_ops: list,
+) -> str:
+    """Build SBP code for one sheet from the assignments that target it."""
+    # Generate toolpath for this sheet
+    tp_result = generate_toolpath_from_operations(
+        sheet_ops, req.detected_operations, req.sheet,
+        sheet_placements, req.object_origins, req.bounding_boxes,
+    )
+
+    # Generate SBP
+    return _generate_sbp_code(
+        tp_result.toolpaths, sheet_ops, req.post_processor, req.sheet
+    )
+
+
 @app.post("/api/generate-sbp-zip")
-def generate_sbp_zip_endpoint(req: SbpZipRequest):
+async def generate_sbp_zip_endpoint(req: SbpZipRequest):
     """Generate SBP files for all sheets and return as ZIP."""
     # Group placements by sheet_id
     sheet_groups: dict[str, list[PlacementItem]] = {}
+    sheets_by_obj: dict[str, set[str]] = {}
     for p in req.placements:
         sheet_groups.setdefault(p.sheet_id, []).append(p)
-
-    buf = io.BytesIO()
-    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
-        for sheet_id in sorted(sheet_groups.keys()):
-            sheet_placements = sheet_groups[sheet_id]
-            sheet_object_ids = {p.object_id for p in sheet_placements}
-
-            # Filter assignments for this sheet
-            op_to_obj = {
-                op.operation_id: op.object_id
-                for op in req.detected_operations.operations
-            }
-            filtered_ops = [
-                a for a in req.operations
-                if op_to_obj.get(a.operation_id) in sheet_object_ids
-            ]
-            if not filtered_ops:
-                continue
-
-            # Generate toolpath for this sheet
-            tp_result = generate_toolpath_from_operations(
-                filtered_ops, req.detected_operations, req.sheet,
-                sheet_placements, req.object_origins, req.bounding_boxes,
-            )
-
-            # Generate SBP
-            sbp_code = _generate_sbp_code(
-                tp_result.toolpaths, filtered_ops, req.post_processor, req.sheet
-            )
-
+        sheets_by_obj.setdefault(p.object_id, set()).add(p.sheet_id)
+
+    # Bucket assignments by sheet in one pass over the operations
+    op_to_obj = {
+        op.operation_id: op.object_id
+        for op in req.detected_operations.operations
+    }
+    ops_by_sheet: dict[str, list] = {}
+    for a in req.operations:
+        for sheet_id in sheets_by_obj.get(op_to_obj.get(a.operation_id), ()):
+            ops_by_sheet.setdefault(sheet_id, []).append(a)
+
+    sheet_ids = sorted(ops_by_sheet)
+    # Sheets are independent, so generate them in parallel worker threads
+    sheet_codes = await asyncio.gather(*(
+        asyncio.to_thread(
+            _generate_sheet_sbp, req, sheet_groups[sheet_id], ops_by_sheet[sheet_id]
+        )
+        for sheet_id in sheet_ids
+    ))
+
+    # Large jobs spill to disk instead of holding the whole archive in memory.
+    # SBP is plain text, so the fastest deflate level loses little size.
+    buf = SpooledTemporaryFile(max_size=_ZIP_SPOOL_BYTES)
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED, compresslevel=1) as zf:
+        for sheet_id, sbp_code in zip(sheet_ids, sheet_codes):
             zf.writestr(f"{sheet_id}.sbp", sbp_code)
-
     buf.seek(0)
+
+    def iter_zip():
+        with buf:
+            yield from iter(lambda: buf.read(_ZIP_CHUNK_BYTES), b"")
+
     return StreamingResponse(
-        buf,
+        iter_zip(),
         media_type="application/zip",
         headers={"Content-Disposition": "attachment; filename=pathdesigner_sheets.zip"},
     )
@@ -575,8 +781,6 @@ def generate_sbp_zip_endpoint(req: SbpZipRequest):
 @app.post("/api/3d-roughing", response_model=ThreeDRoughingResult)
 def three_d_roughing_endpoint(req: ThreeDRoughingRequest):
     """Generate waterline roughing toolpaths from a mesh file."""
-    from nodes.three_d_milling import generate_waterline_roughing
-
     stl_path = _resolve_stl_for_file_id(req.file_id)
     req.mesh_file_path = str(stl_path)
 
@@ -591,8 +795,6 @@ def three_d_roughing_endpoint(req: ThreeDRoughingRequest):
 @app.post("/api/3d-finishing", response_model=ThreeDFinishingResult)
 def three_d_finishing_endpoint(req: ThreeDFinishingRequest):
     """Generate raster finishing toolpaths from a mesh file."""
-    from nodes.three_d_milling import generate_raster_finishing
-
     stl_path = _resolve_stl_for_file_id(req.file_id)
     req.mesh_file_path = str(stl_path)
 
@@ -619,8 +821,12 @@ def merge_toolpaths(req: MergeToolpathsRequest):
 @app.get("/ai-cad/models", response_model=list[ModelInfo])
 def get_ai_cad_models():
     """Return available models with role and default info."""
-    from llm_client import PIPELINE_MODELS, AVAILABLE_MODELS
+    return _ai_cad_models()
+
 
+@functools.cache
+def _ai_cad_models() -> list[dict]:
+    # Built once: the model table and pipeline defaults are module constants
     result = []
     for model_id, info in AVAILABLE_MODELS.items():
         role = info.get("role", "coder")
@@ -649,6 +855,34 @@ _SKETCH_PREAMBLE = (
 )
 
 
+_STAGE_MESSAGES = {
+    "designing": "設計中...",
+    "coding": "コーディング中...",
+    "refining": "修正中...",
+    "reviewing": "レビュー中...",
+    "executing": "実行中...",
+    "retrying": "リトライ中...",
+}
+# Pending SSE frames per /ai-cad/generate stream
+_SSE_QUEUE_SIZE = 32
+
+
+def _sse(event: str, data: str) -> str:
+    """Format one server-sent event frame from an already-encoded payload."""
+    return f"event: {event}\ndata: {data}\n\n"
+
+
+def _sse_json(event: str, payload: dict) -> str:
+    return _sse(event, json.dumps(payload))
+
+
+@functools.cache
+def _sse_stage(stage: str) -> str:
+    # Stage frames repeat across requests; encode each one once
+    message = _STAGE_MESSAGES.get(stage, stage)
+    return _sse_json("stage", {"stage": stage, "message": message})
+
+
 @app.post("/ai-cad/generate")
 async def ai_cad_generate(req: AiCadRequest):
     """Generate 3D model from text/image prompt via LLM pipeline (SSE stream)."""
@@ -664,24 +898,27 @@ async def ai_cad_generate(req: AiCadRequest):
 
         # Validate: need either prompt text or image
         if not full_prompt.strip() and not req.image_base64:
-            data = json.dumps({"message": "prompt or image_base64 is required"})
-            yield f"event: error\ndata: {data}\n\n"
+            yield _sse_json("error", {"message": "prompt or image_base64 is required"})
             return
 
-        event_queue: asyncio.Queue[tuple[str, str, str] | None] = asyncio.Queue()
+        # Bounded so a stalled client pushes back on the pipeline instead of
+        # letting frames pile up
+        event_queue: asyncio.Queue[tuple[str, str] | None] = asyncio.Queue(
+            maxsize=_SSE_QUEUE_SIZE
+        )
+        last_stage: str | None = None
 
         async def queue_stage(stage: str):
-            messages = {
-                "designing": "設計中...",
-                "coding": "コーディング中...",
-                "reviewing": "レビュー中...",
-                "executing": "実行中...",
-                "retrying": "リトライ中...",
-            }
-            await event_queue.put(("stage", stage, messages.get(stage, stage)))
+            nonlocal last_stage
+            if stage == last_stage:
+                return  # the client is already showing this stage
+            last_stage = stage
+            await event_queue.put(("stage", _sse_stage(stage)))
 
         async def queue_detail(key: str, value: str):
-            await event_queue.put(("detail", key, value))
+            await event_queue.put(
+                ("detail", _sse_json("detail", {"key": key, "value": value}))
+            )
 
         result_holder: dict = {}
 
@@ -695,34 +932,46 @@ async def ai_cad_generate(req: AiCadRequest):
                     designer_model=req.designer_model,
                     on_stage=queue_stage,
                     on_detail=queue_detail,
+                    fused=req.fused,
                 )
                 result_holder["code"] = code
                 result_holder["objects"] = objects
                 result_holder["step_bytes"] = step_bytes
             except Exception as e:
                 result_holder["error"] = str(e)
-            finally:
-                await event_queue.put(None)  # sentinel
+            # Not in a finally: once cancelled there is no reader left, and
+            # waiting for room in a full queue would never return
+            await event_queue.put(None)  # sentinel
 
         task = asyncio.create_task(run_pipeline())
-
-        while True:
-            event = await event_queue.get()
-            if event is None:
-                break
-            event_type, key, value = event
-            if event_type == "stage":
-                data = json.dumps({"stage": key, "message": value})
-                yield f"event: stage\ndata: {data}\n\n"
-            elif event_type == "detail":
-                data = json.dumps({"key": key, "value": value})
-                yield f"event: detail\ndata: {data}\n\n"
-
-        await task
+        try:
+            finished = False
+            while not finished:
+                # Send everything queued since the last wakeup as one chunk
+                batch = [await event_queue.get()]
+                while not event_queue.empty():
+                    batch.append(event_queue.get_nowait())
+                if batch[-1] is None:
+                    finished = True
+                    batch.pop()
+                # Only the newest stage in a batch matters to the UI
+                last = max(
+                    (i for i, (kind, _) in enumerate(batch) if kind == "stage"),
+                    default=-1,
+                )
+                frames = [
+                    frame for i, (kind, frame) in enumerate(batch)
+                    if kind != "stage" or i == last
+                ]
+                if frames:
+                    yield "".join(frames)
+            await task
+        finally:
+            # Client disconnected mid-stream: stop spending LLM calls
+            task.cancel()
 
         if "error" in result_holder:
-            data = json.dumps({"message": result_holder["error"]})
-            yield f"event: error\ndata: {data}\n\n"
+            yield _sse_json("error", {"message": result_holder["error"]})
             return
 
         code = result_holder["code"]
@@ -739,13 +988,9 @@ async def ai_cad_generate(req: AiCadRequest):
 
         step_path = None
         if step_bytes:
-            gen_dir = GENERATIONS_DIR / file_id
-            gen_dir.mkdir(exist_ok=True)
-            step_file = gen_dir / "model.step"
-            step_file.write_bytes(step_bytes)
-            step_path = str(step_file)
-            (UPLOAD_DIR / f"{file_id}.step").write_bytes(step_bytes)
-
+            step_path = str(
+                await asyncio.to_thread(_save_generation_step, file_id, step_bytes)
+            )
         gen_id = await db.save_generation(
             prompt=full_prompt, code=code,
             result_json=brep_result.model_dump_json(),
@@ -758,8 +1003,7 @@ async def ai_cad_generate(req: AiCadRequest):
             generated_code=code, generation_id=gen_id,
             prompt_used=full_prompt, model_used="pipeline",
         )
-        data = result.model_dump_json()
-        yield f"event: result\ndata: {data}\n\n"
+        yield _sse("result", result.model_dump_json())
 
     return StreamingResponse(
         event_stream(),
@@ -774,7 +1018,7 @@ async def ai_cad_execute(req: AiCadCodeRequest):
     db = await _get_db()
 
     try:
-        objects, step_bytes = execute_build123d_code(req.code)
+        objects, step_bytes = await asyncio.to_thread(execute_build123d_code, req.code)
     except CodeExecutionError as e:
         raise HTTPException(status_code=422, detail=str(e))
 
@@ -785,11 +1029,7 @@ async def ai_cad_execute(req: AiCadCodeRequest):
 
     # Save STEP to uploads for downstream compatibility
     if step_bytes:
-        (UPLOAD_DIR / f"{file_id}.step").write_bytes(step_bytes)
-        gen_dir = GENERATIONS_DIR / file_id
-        gen_dir.mkdir(exist_ok=True)
-        (gen_dir / "model.step").write_bytes(step_bytes)
-
+        await asyncio.to_thread(_save_generation_step, file_id, step_bytes)
     gen_id = await db.save_generation(
         prompt="(manual code)", code=req.code,
         result_json=result.model_dump_json(),
@@ -813,12 +1053,11 @@ async def ai_cad_refine(req: AiCadRefineRequest):
 
     async def event_stream():
         if not gen_row:
-            data = json.dumps({"message": "Generation not found"})
-            yield f"event: error\ndata: {data}\n\n"
+            yield _sse_json("error", {"message": "Generation not found"})
             return
 
         try:
-            yield f"event: stage\ndata: {json.dumps({'stage': 'refining', 'message': '修正中...'})}\n\n"
+            yield _sse_stage("refining")
 
             llm_history = [
                 {"role": m.role, "content": m.content}
@@ -832,15 +1071,15 @@ async def ai_cad_refine(req: AiCadRefineRequest):
                 profile=req.profile,
             )
 
-            yield f"event: stage\ndata: {json.dumps({'stage': 'reviewing', 'message': 'レビュー中...'})}\n\n"
+            yield _sse_stage("reviewing")
             code = await llm._self_review(req.message, code, profile=req.profile)
 
-            yield f"event: stage\ndata: {json.dumps({'stage': 'executing', 'message': '実行中...'})}\n\n"
+            yield _sse_stage("executing")
 
             try:
-                objects, step_bytes = execute_build123d_code(code)
+                objects, step_bytes = await asyncio.to_thread(execute_build123d_code, code)
             except CodeExecutionError as exec_err:
-                yield f"event: stage\ndata: {json.dumps({'stage': 'retrying', 'message': 'リトライ中...'})}\n\n"
+                yield _sse_stage("retrying")
 
                 retry_history = llm_history + [
                     {"role": "assistant", "content": code},
@@ -854,27 +1093,23 @@ async def ai_cad_refine(req: AiCadRefineRequest):
                     profile=req.profile,
                 )
 
-                yield f"event: stage\ndata: {json.dumps({'stage': 'reviewing', 'message': 'レビュー中...'})}\n\n"
+                yield _sse_stage("reviewing")
                 code = await llm._self_review(retry_msg, code, profile=req.profile)
 
-                yield f"event: stage\ndata: {json.dumps({'stage': 'executing', 'message': '実行中...'})}\n\n"
-                objects, step_bytes = execute_build123d_code(code)
+                yield _sse_stage("executing")
+                objects, step_bytes = await asyncio.to_thread(execute_build123d_code, code)
 
             file_id = f"ai-cad-{uuid.uuid4().hex[:8]}"
             brep_result = BrepImportResult(
                 file_id=file_id, objects=objects, object_count=len(objects),
             )
 
-            if step_bytes:
-                gen_dir = GENERATIONS_DIR / file_id
-                gen_dir.mkdir(exist_ok=True)
-                (gen_dir / "model.step").write_bytes(step_bytes)
-                (UPLOAD_DIR / f"{file_id}.step").write_bytes(step_bytes)
-
             new_history = [m.model_dump() for m in req.history] + [
                 {"role": "user", "content": req.message},
                 {"role": "assistant", "content": code},
             ]
+            if step_bytes:
+                await asyncio.to_thread(_save_generation_step, file_id, step_bytes)
             await db.update_generation(
                 req.generation_id,
                 code=code,
@@ -891,12 +1126,12 @@ async def ai_cad_refine(req: AiCadRefineRequest):
                 generation_id=req.generation_id,
                 ai_message="修正を適用しました。",
             )
-            yield f"event: result\ndata: {result.model_dump_json()}\n\n"
+            yield _sse("result", result.model_dump_json())
 
         except CodeExecutionError as e:
-            yield f"event: error\ndata: {json.dumps({'message': f'コード実行エラー: {e}'})}\n\n"
+            yield _sse_json("error", {"message": f"コード実行エラー: {e}"})
         except Exception as e:
-            yield f"event: error\ndata: {json.dumps({'message': str(e)})}\n\n"
+            yield _sse_json("error", {"message": str(e)})
 
     return StreamingResponse(
         event_stream(),
@@ -906,20 +1141,24 @@ async def ai_cad_refine(req: AiCadRefineRequest):
 
 
 @app.get("/ai-cad/library", response_model=list[GenerationSummary])
-async def ai_cad_library(search: str | None = None, limit: int = 50, offset: int = 0):
-    """List past generations."""
+async def ai_cad_library(
+    search: str | None = None,
+    limit: int = 50,
+    offset: int = 0,
+    cursor: str | None = None,
+):
+    """List past generations.
+
+    Pass ``cursor=<created_at>,<generation_id>`` of the last item to fetch
+    the next page without the cost of a deep OFFSET.
+    """
     db = await _get_db()
-    rows = await db.list_generations(search=search, limit=limit, offset=offset)
-    return [
-        GenerationSummary(
-            generation_id=r["id"],
-            prompt=r["prompt"],
-            model_used=r["model_used"],
-            status=r["status"],
-            created_at=r["created_at"],
-        )
-        for r in rows
-    ]
+    body = await db.list_generations_json(
+        search=search, limit=limit, offset=offset,
+        cursor=_parse_page_cursor(cursor),
+    )
+    # SQLite already produced the GenerationSummary list
+    return Response(content=body, media_type="application/json")
 
 
 @app.get("/ai-cad/library/{gen_id}", response_model=AiCadResult)
@@ -961,43 +1200,63 @@ async def ai_cad_delete(gen_id: str):
 async def save_snippet(req: SnippetSaveRequest):
     """Save a snippet to the library."""
     db = await _get_snippets_db()
-    snippet_id = await db.save_snippet(
-        name=req.name,
-        code=req.code,
-        tags=req.tags,
-        thumbnail_png=req.thumbnail_png,
-        source_generation_id=req.source_generation_id,
-    )
+    try:
+        snippet_id = await db.save_snippet(
+            name=req.name,
+            code=req.code,
+            tags=req.tags,
+            thumbnail_png=req.thumbnail_png,
+            source_generation_id=req.source_generation_id,
+        )
+    except ValueError:
+        # binascii.Error for bad base64, plain ValueError for non-ASCII text
+        raise HTTPException(status_code=422, detail="thumbnail_png is not valid base64")
     row = await db.get_snippet(snippet_id)
     return SnippetInfo(
         id=row["id"],
         name=row["name"],
         tags=json.loads(row["tags"] or "[]"),
         code=row["code"],
-        thumbnail_png=row["thumbnail_png"],
+        thumbnail_url=f"/snippets/{row['id']}/thumbnail" if row["has_thumbnail"] else None,
         source_generation_id=row["source_generation_id"],
         created_at=row["created_at"],
     )
 
 
 @app.get("/snippets", response_model=SnippetListResponse)
-async def list_snippets(q: str = "", limit: int = 50, offset: int = 0):
-    """List snippets with optional name search."""
+async def list_snippets(
+    q: str = "",
+    limit: int = 50,
+    offset: int = 0,
+    cursor: str | None = None,
+    tag: list[str] = Query(default=[]),
+):
+    """List snippets with optional name search.
+
+    Repeat ``tag=`` to keep only snippets carrying every given tag.
+    ``next_cursor`` in the response fetches the following page.
+    """
     db = await _get_snippets_db()
-    rows, total = await db.list_snippets(q=q, limit=limit, offset=offset)
-    snippets = [
-        SnippetInfo(
-            id=r["id"],
-            name=r["name"],
-            tags=json.loads(r["tags"] or "[]"),
-            code=r["code"],
-            thumbnail_png=r["thumbnail_png"],
-            source_generation_id=r["source_generation_id"],
-            created_at=r["created_at"],
-        )
-        for r in rows
-    ]
-    return SnippetListResponse(snippets=snippets, total=total)
+    body = await db.list_snippets_json(
+        q=q, limit=limit, offset=offset, cursor=_parse_page_cursor(cursor), tags=tag,
+    )
+    # SQLite already produced the SnippetListResponse document
+    return Response(content=body, media_type="application/json")
+
+
+@app.get("/snippets/{snippet_id}/thumbnail")
+async def get_snippet_thumbnail(snippet_id: str):
+    """Serve a snippet's PNG thumbnail."""
+    db = await _get_snippets_db()
+    png = await db.get_snippet_thumbnail(snippet_id)
+    if png is None:
+        raise HTTPException(status_code=404, detail="Thumbnail not found")
+    # Thumbnails never change for a given snippet ID
+    return Response(
+        content=png,
+        media_type="image/png",
+        headers={"Cache-Control": "public, max-age=31536000, immutable"},
+    )
 
 
 @app.delete("/snippets/{snippet_id}")
@@ -1019,19 +1278,15 @@ async def execute_snippet(snippet_id: str):
         raise HTTPException(status_code=404, detail="Snippet not found")
 
     try:
-        objects, step_bytes = execute_build123d_code(row["code"])
+        objects, step_bytes = await asyncio.to_thread(execute_build123d_code, row["code"])
     except CodeExecutionError as e:
         raise HTTPException(status_code=422, detail=str(e))
 
     file_id = f"snippet-{uuid.uuid4().hex[:8]}"
-    if step_bytes:
-        (UPLOAD_DIR / f"{file_id}.step").write_bytes(step_bytes)
-        gen_dir = GENERATIONS_DIR / file_id
-        gen_dir.mkdir(exist_ok=True)
-        (gen_dir / "model.step").write_bytes(step_bytes)
-
     result = BrepImportResult(file_id=file_id, objects=objects, object_count=len(objects))
     gen_db = await _get_db()
+    if step_bytes:
+        await asyncio.to_thread(_save_generation_step, file_id, step_bytes)
     gen_id = await gen_db.save_generation(
         prompt=f"(snippet: {row['name']})",
         code=row["code"],
@@ -1,5 +1,8 @@
 """BREP Import Node — STEP file analysis using build123d."""
 
+import copy
+import threading
+from collections import OrderedDict
 from pathlib import Path
 
 from build123d import Axis, GeomType, Solid, import_step
@@ -13,10 +16,38 @@ from schemas import (
 )
 
 
+# Parsed STEP files, keyed by (path, mtime_ns, size). Upload, align, detect,
+# contour and mesh requests usually hit the same file back to back, and the
+# OCC import dominates each of them.
+_STEP_CACHE_SIZE = 8
+_step_cache: OrderedDict[tuple[str, int, int], list[Solid]] = OrderedDict()
+_step_cache_lock = threading.Lock()
+
+
+def load_step_solids(filepath: str | Path) -> list[Solid]:
+    """Return the solids of a STEP file, parsing it at most once per version.
+
+    Callers get their own copies, so they may move or tessellate them freely
+    (build123d's ``move`` mutates in place) without touching the cache.
+    """
+    st = Path(filepath).stat()
+    key = (str(filepath), st.st_mtime_ns, st.st_size)
+    with _step_cache_lock:
+        solids = _step_cache.get(key)
+        if solids is not None:
+            _step_cache.move_to_end(key)
+    if solids is None:
+        solids = list(import_step(str(filepath)).solids())
+        with _step_cache_lock:
+            _step_cache[key] = solids
+            while len(_step_cache) > _STEP_CACHE_SIZE:
+                _step_cache.popitem(last=False)
+    return [copy.deepcopy(s) for s in solids]
+
+
 def analyze_step_file(filepath: str | Path, file_name: str) -> list[BrepObject]:
     """Import a STEP file and analyze each solid for CNC machining."""
-    compound = import_step(str(filepath))
-    solids = compound.solids()
+    solids = load_step_solids(filepath)
 
     if not solids:
         raise ValueError("STEP file contains no solid objects")
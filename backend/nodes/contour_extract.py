@@ -3,9 +3,10 @@
 import math
 from pathlib import Path
 
-from build123d import Solid, import_step
+from build123d import Solid
 from shapely.geometry import Polygon
 
+from nodes.brep_import import load_step_solids
 from nodes.geometry_utils import intersect_solid_at_z, sample_wire_coords
 from schemas import Contour, ContourExtractResult, OffsetApplied
 
@@ -25,8 +26,7 @@ def extract_contours(
     If *solid* is provided, it is used directly and the STEP file is not re-imported.
     """
     if solid is None:
-        compound = import_step(str(step_path))
-        solids = compound.solids()
+        solids = load_step_solids(step_path)
         if not solids:
             raise ValueError("STEP file contains no solids")
 
@@ -4,7 +4,8 @@ from pathlib import Path
 
 import numpy as np
 import trimesh
-from build123d import import_step
+
+from nodes.brep_import import load_step_solids
 
 
 def export_step_to_stl(
@@ -16,8 +17,7 @@ def export_step_to_stl(
         output_dir = step_path.parent
     output_dir = Path(output_dir)
 
-    compound = import_step(str(step_path))
-    solids = compound.solids()
+    solids = load_step_solids(step_path)
     if not solids:
         raise ValueError("STEP file contains no solids")
 
@@ -54,8 +54,7 @@ def tessellate_step_file(
             "faces": [i0, j0, k0, i1, j1, k1, ...],      # flat
         }
     """
-    compound = import_step(str(filepath))
-    solids = compound.solids()
+    solids = load_step_solids(filepath)
 
     meshes = []
     for i, solid in enumerate(solids):
@@ -2,6 +2,8 @@
 
 from __future__ import annotations
 
+import numpy as np
+import shapely
 from shapely.affinity import rotate as shapely_rotate
 from shapely.affinity import translate as shapely_translate
 from shapely.geometry import Polygon, box
@@ -102,9 +104,15 @@ def _try_place_blf(
     sheet_h: float,
     step: float = 5.0,
 ) -> tuple[float, float, int] | None:
-    """Try to place part on sheet using BLF. Returns (x, y, angle) or None."""
-    best: tuple[float, float, int] | None = None
-    best_score = (float("inf"), float("inf"))
+    """Try to place part on sheet using BLF. Returns (x, y, angle) or None.
+
+    Each grid row (one y, every x) is tested in bulk: candidates are built
+    and checked against the placed parts with vectorised Shapely calls, and
+    the leftmost free x wins, as in a scalar bottom-left scan.
+    """
+    placed_geoms = np.asarray(placed, dtype=object)
+    placed_bounds = shapely.bounds(placed_geoms).reshape(-1, 4)
+    sminx, sminy, smaxx, smaxy = sheet_poly.bounds
 
     for angle in range(0, 360, 45):
         rotated = shapely_rotate(part, angle, origin="centroid") if angle else part
@@ -121,29 +129,50 @@ def _try_place_blf(
         shift_y = -miny
         normalized = shapely_translate(rotated, shift_x, shift_y)
 
+        xs: list[float] = []
+        x = 0.0
+        while x + part_w <= sheet_w:
+            xs.append(x)
+            x += step
+        if not xs:
+            continue
+
         # Grid search: bottom-left first (y ascending, then x ascending)
         y = 0.0
         while y + part_h <= sheet_h:
-            x = 0.0
-            while x + part_w <= sheet_w:
-                candidate = shapely_translate(normalized, x, y)
-                if sheet_poly.contains(candidate) and not any(
-                    candidate.intersects(p) for p in placed
-                ):
-                    score = (y, x)
-                    if score < best_score:
-                        best_score = score
-                        best = (x, y, angle)
-                    break  # Found leftmost position at this y
-                x += step
-            if best and best_score[0] == y:
-                break  # Found at this y level, no need to go higher
+            candidates = _translated_row(normalized, xs, y)
+            cb = shapely.bounds(candidates)
+            # sheet_poly is a rectangle, so containment is a bounds test
+            free = (
+                (cb[:, 0] >= sminx) & (cb[:, 1] >= sminy)
+                & (cb[:, 2] <= smaxx) & (cb[:, 3] <= smaxy)
+            )
+            # Only pairs whose boxes overlap can intersect
+            ci, pi = np.nonzero(
+                (cb[:, None, 0] <= placed_bounds[None, :, 2])
+                & (cb[:, None, 2] >= placed_bounds[None, :, 0])
+                & (cb[:, None, 1] <= placed_bounds[None, :, 3])
+                & (cb[:, None, 3] >= placed_bounds[None, :, 1])
+            )
+            if len(ci):
+                hit = shapely.intersects(candidates[ci], placed_geoms[pi])
+                free[ci[hit]] = False
+            if free.any():
+                return xs[int(np.argmax(free))], y, angle
             y += step
 
-        if best:
-            break  # Found a placement, use it
+    return None
+
 
-    return best
+def _translated_row(part: Polygon, xs: list[float], y: float) -> np.ndarray:
+    """Copies of part translated to (x, y) for every x, as a geometry array."""
+    if part.interiors:
+        return np.array(
+            [shapely_translate(part, x, y) for x in xs], dtype=object,
+        )
+    ring = shapely.get_coordinates(part.exterior)
+    offsets = np.column_stack([xs, np.full(len(xs), y)])
+    return shapely.polygons(ring[None, :, :] + offsets[:, None, :])
 
 
 def _position_polygon(part: Polygon, x: float, y: float, angle: int) -> Polygon:
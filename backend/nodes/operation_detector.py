@@ -3,8 +3,9 @@
 import math
 from pathlib import Path
 
-from build123d import GeomType, Plane, ShapeList, Solid, import_step
+from build123d import GeomType, Plane, ShapeList, Solid
 
+from nodes.brep_import import load_step_solids
 from nodes.contour_extract import extract_contours
 from nodes.geometry_utils import sample_wire_coords
 from schemas import (
@@ -31,8 +32,7 @@ def detect_operations(
     Detects contour, pocket, and drill operations by analyzing the solid's
     cylindrical faces and planar features.
     """
-    compound = import_step(str(step_path))
-    solids = compound.solids()
+    solids = load_step_solids(step_path)
     operations: list[DetectedOperation] = []
     op_counter = 0
 
@@ -538,6 +538,7 @@ class AiCadRequest(BaseModel):
     profile: str = "general"
     coder_model: str | None = None  # Override coder model for pipeline
     designer_model: str | None = None  # Override designer model for pipeline
+    fused: bool = False  # Design + code in one coder call, no review stage
 
 
 class AiCadCodeRequest(BaseModel):
@@ -622,7 +623,7 @@ class SnippetInfo(BaseModel):
     name: str
     tags: list[str]
     code: str
-    thumbnail_png: str | None
+    thumbnail_url: str | None               # GET path of the PNG, if any
     source_generation_id: str | None
     created_at: str
 
@@ -630,3 +631,4 @@ class SnippetInfo(BaseModel):
 class SnippetListResponse(BaseModel):
     snippets: list[SnippetInfo]
     total: int
+    next_cursor: str | None = None
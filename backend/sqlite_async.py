@@ -0,0 +1,84 @@
+"""Thin asyncio wrapper around a single sqlite3 connection.
+
+Every call runs on one dedicated worker thread, so the connection is only
+ever touched from that thread and statements are naturally serialized.
+Each call is a single executor submit; ``run`` lets a caller push several
+statements (and their commit) to the worker in one hop.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, TypeVar
+
+T = TypeVar("T")
+
+
+class Result:
+    """Rows and counters of an executed statement, already fetched."""
+
+    __slots__ = ("rows", "rowcount", "lastrowid")
+
+    def __init__(self, rows: list, rowcount: int, lastrowid: int | None):
+        self.rows = rows
+        self.rowcount = rowcount
+        self.lastrowid = lastrowid
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    def fetchall(self) -> list:
+        return self.rows
+
+
+def _execute(conn: sqlite3.Connection, sql: str, params) -> Result:
+    cursor = conn.execute(sql, params)
+    return Result(cursor.fetchall(), cursor.rowcount, cursor.lastrowid)
+
+
+def _executemany(conn: sqlite3.Connection, sql: str, rows) -> Result:
+    cursor = conn.executemany(sql, rows)
+    return Result([], cursor.rowcount, cursor.lastrowid)
+
+
+class AsyncSqlite:
+    """A sqlite3 connection driven from asyncio through one worker thread."""
+
+    def __init__(self, conn: sqlite3.Connection, executor: ThreadPoolExecutor):
+        self._conn = conn
+        self._executor = executor
+
+    @classmethod
+    async def connect(cls, path: str, **kwargs: Any) -> AsyncSqlite:
+        """Open ``path`` on a fresh worker thread. kwargs go to sqlite3.connect."""
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+        conn = await asyncio.wrap_future(
+            executor.submit(sqlite3.connect, path, check_same_thread=False, **kwargs)
+        )
+        return cls(conn, executor)
+
+    async def run(self, fn: Callable[..., T], *args: Any) -> T:
+        """Call ``fn(conn, *args)`` on the worker thread."""
+        return await asyncio.wrap_future(
+            self._executor.submit(fn, self._conn, *args)
+        )
+
+    async def execute(self, sql: str, params=()) -> Result:
+        return await self.run(_execute, sql, params)
+
+    async def executemany(self, sql: str, rows) -> Result:
+        return await self.run(_executemany, sql, rows)
+
+    async def executescript(self, script: str) -> None:
+        await self.run(sqlite3.Connection.executescript, script)
+
+    async def commit(self) -> None:
+        await self.run(sqlite3.Connection.commit)
+
+    async def close(self) -> None:
+        try:
+            await self.run(sqlite3.Connection.close)
+        finally:
+            self._executor.shutdown(wait=False)
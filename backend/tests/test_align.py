@@ -121,3 +121,57 @@ def test_align_parts_file_not_found(client):
     """Should return 404 for unknown file_id."""
     resp = client.post("/api/align-parts", json={"file_id": "nonexistent"})
     assert resp.status_code == 404
+
+
+def test_uploaded_and_aligned_files_are_indexed(client):
+    """Saved files are recorded so later lookups skip the uploads glob."""
+    import main
+
+    file_id = _upload_furniture_step(client)
+    assert main._UPLOAD_INDEX[file_id].exists()
+
+    resp = client.post("/api/align-parts", json={"file_id": file_id})
+    new_id = resp.json()["file_id"]
+    assert main._get_uploaded_step_path(new_id) == main._UPLOAD_INDEX[new_id]
+
+
+def test_step_parsed_once_and_aligning_leaves_cache_intact(simple_box_step, monkeypatch):
+    """Repeat loads reuse the parsed STEP; callers get independent copies."""
+    import nodes.brep_import as brep_import
+
+    calls = []
+    real_import = brep_import.import_step
+
+    def counting_import(path):
+        calls.append(path)
+        return real_import(path)
+
+    monkeypatch.setattr(brep_import, "import_step", counting_import)
+    monkeypatch.setattr(brep_import, "_step_cache", type(brep_import._step_cache)())
+
+    first = brep_import.load_step_solids(simple_box_step)
+    z0 = first[0].bounding_box().min.Z
+    align_solids(first)
+    first[0].move(Pos(0, 0, 500))
+    second = brep_import.load_step_solids(simple_box_step)
+
+    assert len(calls) == 1
+    assert second[0] is not first[0]
+    assert second[0].bounding_box().min.Z == pytest.approx(z0)
+
+
+def test_unindexed_step_found_without_directory_scan(monkeypatch):
+    """Files from before a restart resolve by name, not by globbing uploads."""
+    import main
+
+    file_id = "cold" + "0" * 8
+    path = main.UPLOAD_DIR / f"{file_id}.step"
+    path.write_bytes(b"ISO-10303-21;")
+    (main.UPLOAD_DIR / f"{file_id}.stl").write_bytes(b"solid")
+    monkeypatch.setattr(main, "_UPLOAD_INDEX", {})
+    monkeypatch.setattr(type(main.UPLOAD_DIR), "glob", lambda *a: pytest.fail("globbed"))
+    try:
+        assert main._get_uploaded_step_path(file_id) == path
+    finally:
+        path.unlink()
+        (main.UPLOAD_DIR / f"{file_id}.stl").unlink()
@@ -35,6 +35,30 @@ def test_execute_code_simple_box():
     assert len(data["objects"]) >= 1
 
 
+def test_execute_code_step_written_once():
+    """The uploads entry is linked to the generation's STEP, not a second copy."""
+    import main
+
+    resp = client.post("/ai-cad/execute", json={"code": "result = Box(100, 50, 10)"})
+    file_id = resp.json()["file_id"]
+    upload = main._get_uploaded_step_path(file_id)
+    stored = main.GENERATIONS_DIR / file_id / "model.step"
+    assert upload.read_bytes() == stored.read_bytes()
+    assert upload.samefile(stored)
+
+
+def test_execute_code_no_row_when_step_write_fails():
+    """A generation row is only recorded once its STEP file is on disk."""
+    with patch("main._save_generation_step", side_effect=OSError("disk full")), \
+            patch("main._get_db") as mock_get_db:
+        db = AsyncMock(save_generation=AsyncMock(return_value="g1"))
+        mock_get_db.return_value = db
+        with pytest.raises(OSError):
+            client.post("/ai-cad/execute", json={"code": "result = Box(100, 50, 10)"})
+
+    db.save_generation.assert_not_awaited()
+
+
 def test_execute_code_syntax_error():
     """POST /ai-cad/execute with invalid code returns 422."""
     resp = client.post("/ai-cad/execute", json={"code": "result = Box(10,"})
@@ -121,3 +145,72 @@ def test_refine_validates_generation_id():
     })
     assert resp.status_code == 200  # SSE always 200
     assert "event: error" in resp.text
+
+
+@pytest.mark.asyncio
+async def test_generate_pipeline_ends_when_stalled_client_disconnects():
+    """A full event queue must not keep the pipeline task alive after disconnect."""
+    import asyncio
+
+    import main
+    from schemas import AiCadRequest
+
+    async def chatty_pipeline(prompt, *, on_detail=None, **kwargs):
+        for i in range(main._SSE_QUEUE_SIZE * 3):
+            await on_detail("code", str(i))
+        return "result = Box(10, 10, 10)", [], b""
+
+    with patch("main._get_llm") as mock_get_llm:
+        mock_get_llm.return_value = MagicMock(generate_pipeline=chatty_pipeline)
+        resp = await main.ai_cad_generate(AiCadRequest(prompt="box"))
+        body = resp.body_iterator
+        await body.__anext__()
+        await asyncio.sleep(0.05)  # client stalls; the queue fills up
+        await body.aclose()  # then disconnects
+        await asyncio.sleep(0.05)
+
+    pending = [
+        t for t in asyncio.all_tasks()
+        if t.get_coro().__name__ == "run_pipeline" and not t.done()
+    ]
+    assert pending == []
+
+
+def test_generate_coalesces_stage_events():
+    """Repeated and superseded stages are not sent; details always are."""
+    import json
+
+    from schemas import BrepObject
+
+    obj = BrepObject.model_validate({
+        "object_id": "obj_001", "file_name": "gen.step",
+        "bounding_box": {"x": 10, "y": 10, "z": 10}, "thickness": 10,
+        "origin": {"position": [0, 0, 0], "reference": "bounding_box_min", "description": ""},
+        "unit": "mm", "is_closed": True, "is_planar": True, "machining_type": "2d",
+        "faces_analysis": {"top_features": False, "bottom_features": False, "freeform_surfaces": False},
+        "outline": [],
+    })
+
+    async def mock_pipeline(prompt, *, on_stage=None, on_detail=None, **kwargs):
+        await on_stage("designing")
+        await on_stage("designing")
+        await on_detail("design", "a box")
+        await on_stage("coding")
+        await on_stage("reviewing")
+        return "result = Box(10, 10, 10)", [obj], b""
+
+    with patch("main._get_llm") as mock_get_llm, patch("main._get_db") as mock_get_db:
+        mock_llm = MagicMock()
+        mock_llm.generate_pipeline = mock_pipeline
+        mock_get_llm.return_value = mock_llm
+        mock_get_db.return_value = AsyncMock(save_generation=AsyncMock(return_value="g1"))
+
+        resp = client.post("/ai-cad/generate", json={"prompt": "box"})
+
+    events = [block.split("\n")[0] for block in resp.text.strip().split("\n\n")]
+    stages = [json.loads(block.split("data: ", 1)[1])["stage"]
+              for block in resp.text.strip().split("\n\n") if block.startswith("event: stage")]
+    assert events.count("event: detail") == 1
+    assert stages[-1] == "reviewing"
+    assert len(stages) == len(set(stages))
+    assert events[-1] == "event: result"
@@ -78,3 +78,23 @@ def test_mesh_upload_freeform(client, freeform_stl):
     data = response.json()
     assert data["objects"][0]["machining_type"] == "3d"
     assert data["objects"][0]["is_closed"] is True
+
+
+def test_mesh_data_endpoint(client, simple_box_step):
+    """mesh-data returns the tessellation for every uploaded solid."""
+    with open(simple_box_step, "rb") as f:
+        upload = client.post(
+            "/api/upload-step",
+            files={"file": ("box.step", f, "application/octet-stream")},
+        )
+    file_id = upload.json()["file_id"]
+
+    response = client.post("/api/mesh-data", json={"file_id": file_id})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/json"
+    objects = response.json()["objects"]
+    assert len(objects) == 1
+    assert objects[0]["object_id"] == "obj_001"
+    assert len(objects[0]["vertices"]) % 3 == 0
+    assert len(objects[0]["faces"]) % 3 == 0
+    assert max(objects[0]["faces"]) < len(objects[0]["vertices"]) // 3
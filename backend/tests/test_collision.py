@@ -185,3 +185,84 @@ def test_same_sheet_collision():
     assert data["valid"] is False
     collision_warnings = [w for w in data["warnings"] if "衝突" in w.lower() or "collision" in w.lower()]
     assert len(collision_warnings) >= 1
+
+
+def test_collision_pairs_reported_in_order():
+    """Each overlapping pair is reported once, ordered by placement index."""
+    placements = [
+        {"object_id": f"obj_{i}", "material_id": "mtl_1", "x_offset": x, "y_offset": 10, "rotation": 0}
+        for i, x in enumerate([10, 60, 300, 110])
+    ]
+    bbs = {f"obj_{i}": {"x": 80, "y": 50, "z": 10} for i in range(4)}
+    resp = _make_request(placements, bbs, tool_diameter=0)
+    collision_warnings = [w for w in resp.json()["warnings"] if "衝突" in w]
+    assert collision_warnings == [
+        "衝突: obj_0 と obj_1 が重なっています",
+        "衝突: obj_1 と obj_3 が重なっています",
+    ]
+
+
+def test_placement_matrix_matches_rotate_then_translate():
+    """The single affine transform equals rotating around the BB center and translating."""
+    from shapely.affinity import affine_transform, rotate, translate
+    from shapely.geometry import Polygon
+
+    from main import _placement_matrix
+    from schemas import BoundingBox, PlacementItem
+
+    outline = Polygon([[0, 0], [120, 0], [120, 30], [40, 30], [40, 80], [0, 80]])
+    bb = BoundingBox(x=120, y=80, z=10)
+    for angle in (0, 45, 90, 135, 180, 270, 315):
+        p = PlacementItem(object_id="o", material_id="m", x_offset=17, y_offset=250, rotation=angle)
+        expected = translate(rotate(outline, angle, origin=(60, 40)), 17, 250)
+        got = affine_transform(outline, _placement_matrix(p, bb))
+        assert got.equals_exact(expected, 1e-9)
+
+
+def test_box_fast_path_matches_polygon_check():
+    """Axis-aligned rectangle arithmetic agrees with the GEOS path."""
+    import random
+    from types import SimpleNamespace
+
+    from main import _box_collisions, _polygon_collisions
+    from schemas import BoundingBox, PlacementItem
+
+    rng = random.Random(3)
+    items = [
+        (
+            PlacementItem(
+                object_id=f"obj_{i}", material_id="mtl_1",
+                x_offset=rng.uniform(0, 500), y_offset=rng.uniform(0, 300),
+                rotation=rng.choice([0, 90, 180, 270]),
+            ),
+            BoundingBox(x=rng.uniform(20, 150), y=rng.uniform(20, 150), z=10),
+        )
+        for i in range(40)
+    ]
+    req = SimpleNamespace(outlines={}, tool_diameter=0)
+    pairs = _box_collisions(items)
+    assert pairs
+    assert pairs == _polygon_collisions(items, req, {})
+
+
+def test_bulk_placement_leaves_cached_outline_untouched():
+    """Placing many copies of one outline yields moved copies, not a moved base."""
+    import numpy as np
+    from shapely.affinity import affine_transform
+    from shapely.geometry import Polygon
+
+    from main import _place_all, _placement_matrix
+    from schemas import BoundingBox, PlacementItem
+
+    outline = Polygon([[0, 0], [120, 0], [120, 30], [40, 30], [40, 80], [0, 80]]).buffer(2)
+    bb = BoundingBox(x=120, y=80, z=10)
+    matrices = [
+        _placement_matrix(
+            PlacementItem(object_id="o", material_id="m", x_offset=x, y_offset=7, rotation=angle), bb,
+        )
+        for x, angle in [(0, 0), (150, 90), (300, 225)]
+    ]
+    placed = _place_all(np.array([outline] * 3, dtype=object), np.array(matrices))
+    for got, m in zip(placed, matrices):
+        assert got.equals_exact(affine_transform(outline, m), 1e-9)
+    assert outline.bounds[0] == -2
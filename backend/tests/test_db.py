@@ -3,7 +3,7 @@
 import pytest
 import pytest_asyncio
 
-from db import GenerationDB
+from db import _LIST_GEN_SQL, GenerationDB
 
 
 @pytest_asyncio.fixture
@@ -121,3 +121,192 @@ async def test_update_generation_code_and_result(db):
     row = await db.get_generation(gen_id)
     assert row["code"] == "new code"
     assert row["result_json"] == '{"new": true}'
+
+
+@pytest.mark.asyncio
+async def test_init_enables_wal(db):
+    """init() switches the database to WAL with relaxed synchronous."""
+    cursor = await db._conn.execute("PRAGMA journal_mode")
+    assert cursor.fetchone()[0] == "wal"
+    cursor = await db._conn.execute("PRAGMA synchronous")
+    assert cursor.fetchone()[0] == 1  # NORMAL
+
+
+@pytest.mark.asyncio
+async def test_list_generations_search_substring(db):
+    """Search matches inside words and Japanese text, like the old LIKE query."""
+    await db.save_generation(
+        prompt="木製の棚を作って", code="c1", result_json="{}", model_used="m1", status="success",
+    )
+    await db.save_generation(
+        prompt="bookshelf", code="c2", result_json="{}", model_used="m1", status="success",
+    )
+
+    assert [r["prompt"] for r in await db.list_generations(search="の棚を")] == ["木製の棚を作って"]
+    assert [r["prompt"] for r in await db.list_generations(search="SHELF")] == ["bookshelf"]
+    # Below the trigram minimum the LIKE fallback is used
+    assert [r["prompt"] for r in await db.list_generations(search="棚")] == ["木製の棚を作って"]
+
+
+@pytest.mark.asyncio
+async def test_search_index_backfilled_for_existing_db(tmp_path):
+    """Rows written before the FTS table existed are searchable after init()."""
+    import sqlite3
+
+    path = tmp_path / "legacy.db"
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE generations (id TEXT PRIMARY KEY, prompt TEXT NOT NULL,"
+        " image_path TEXT, code TEXT NOT NULL, result_json TEXT, step_path TEXT,"
+        " model_used TEXT NOT NULL, status TEXT NOT NULL, error_message TEXT,"
+        " tags TEXT, created_at TEXT NOT NULL)"
+    )
+    conn.execute(
+        "INSERT INTO generations (id, prompt, code, model_used, status, created_at)"
+        " VALUES ('old1', 'legacy bracket', 'c', 'm1', 'success', '2026-01-01')"
+    )
+    conn.commit()
+    conn.close()
+
+    legacy = GenerationDB(path)
+    await legacy.init()
+    try:
+        items = await legacy.list_generations(search="bracket")
+        assert [r["id"] for r in items] == ["old1"]
+        await legacy.delete_generation("old1")
+        assert await legacy.list_generations(search="bracket") == []
+    finally:
+        await legacy.close()
+
+
+@pytest.mark.asyncio
+async def test_migration_recorded_in_user_version(tmp_path):
+    """A legacy table gains conversation_history once, then init skips the check."""
+    import sqlite3
+
+    path = tmp_path / "legacy.db"
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE generations (id TEXT PRIMARY KEY, prompt TEXT NOT NULL,"
+        " image_path TEXT, code TEXT NOT NULL, result_json TEXT, step_path TEXT,"
+        " model_used TEXT NOT NULL, status TEXT NOT NULL, error_message TEXT,"
+        " tags TEXT, created_at TEXT NOT NULL)"
+    )
+    conn.commit()
+    conn.close()
+
+    for _ in range(2):
+        legacy = GenerationDB(path)
+        await legacy.init()
+        try:
+            version = (await legacy._conn.execute("PRAGMA user_version")).fetchone()[0]
+            assert version == 2
+            gen_id = await legacy.save_generation(
+                prompt="p", code="c", result_json=None, model_used="m",
+                status="success", conversation_history="[]",
+            )
+            assert (await legacy.get_generation(gen_id))["conversation_history"] == "[]"
+        finally:
+            await legacy.close()
+
+
+@pytest.mark.asyncio
+async def test_list_generations_uses_index_order(db):
+    """The recent-first listing is an index scan, not a full sort."""
+    for keyset, params in ((False, (50, 0)), (True, ("2026", "x", 50, 0))):
+        cursor = await db._conn.execute(
+            "EXPLAIN QUERY PLAN " + _LIST_GEN_SQL["all", keyset], params
+        )
+        plan = " ".join(str(r[3]) for r in cursor.fetchall())
+        assert "ix_gen_created_desc" in plan
+        assert "TEMP B-TREE" not in plan
+
+
+@pytest.mark.asyncio
+async def test_list_generations_cursor_pages(db):
+    for i in range(5):
+        await db.save_generation(
+            prompt=f"plate {i}", code="", result_json=None,
+            model_used="m", status="success",
+        )
+    seen = []
+    cursor = None
+    while True:
+        page = await db.list_generations(limit=2, cursor=cursor)
+        if not page:
+            break
+        seen.extend(r["id"] for r in page)
+        cursor = (page[-1]["created_at"], page[-1]["id"])
+    assert seen == [r["id"] for r in await db.list_generations()]
+    assert len(seen) == 5
+
+
+@pytest.mark.asyncio
+async def test_list_generations_json(db):
+    import json
+
+    for i in range(3):
+        await db.save_generation(
+            prompt=f"gear {i}", code="", result_json=None,
+            model_used="m", status="success",
+        )
+    rows = await db.list_generations(search="gear")
+    items = json.loads(await db.list_generations_json(search="gear"))
+    assert [it["generation_id"] for it in items] == [r["id"] for r in rows]
+    assert set(items[0]) == {"generation_id", "prompt", "model_used", "status", "created_at"}
+    assert json.loads(await db.list_generations_json(search="zz")) == []
+
+
+@pytest.mark.asyncio
+async def test_concurrent_saves_share_one_commit(db):
+    """A burst of writes is committed together rather than one fsync each."""
+    import asyncio
+
+    from db import _apply_writes
+
+    commits = 0
+    original_run = db._conn.run
+
+    async def counting_run(fn, *args):
+        nonlocal commits
+        if fn is _apply_writes:
+            commits += 1
+        return await original_run(fn, *args)
+
+    db._conn.run = counting_run
+    ids = await asyncio.gather(*(
+        db.save_generation(
+            prompt=f"part {i}", code="c", result_json="{}", model_used="m1", status="success",
+        )
+        for i in range(10)
+    ))
+    db._conn.run = original_run
+
+    assert len(set(ids)) == 10
+    assert commits < 10
+    assert len(await db.list_generations()) == 10
+
+
+def test_failed_commit_is_rolled_back():
+    """Writes reported as failed must not be committed by the next batch."""
+    import sqlite3
+
+    from db import _apply_writes
+
+    class FlakyCommit(sqlite3.Connection):
+        fail = True
+
+        def commit(self):
+            if self.fail:
+                self.fail = False
+                raise sqlite3.OperationalError("disk I/O error")
+            super().commit()
+
+    conn = sqlite3.connect(":memory:", factory=FlakyCommit)
+    conn.execute("CREATE TABLE t (v INTEGER)")
+    conn.fail = True
+
+    first = _apply_writes(conn, [[("INSERT INTO t VALUES (?)", (1,), False)]])
+    assert isinstance(first[0], sqlite3.OperationalError)
+    assert _apply_writes(conn, [[("INSERT INTO t VALUES (?)", (2,), False)]]) == [1]
+    assert conn.execute("SELECT v FROM t").fetchall() == [(2,)]
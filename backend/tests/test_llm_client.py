@@ -1,6 +1,7 @@
 """Tests for OpenRouter LLM client."""
 
 import os
+from types import SimpleNamespace
 from unittest.mock import AsyncMock, patch, MagicMock
 
 import pytest
@@ -13,6 +14,30 @@ sys.path.insert(0, str(Path(__file__).parent.parent))
 from llm_client import LLMClient, AVAILABLE_MODELS
 
 
+class _Reply:
+    """A canned chat completion, usable as a plain response or as a stream."""
+
+    def __init__(self, text: str, chunk_size: int = 8):
+        self.choices = [SimpleNamespace(message=SimpleNamespace(content=text))]
+        self.usage = None
+        self.closed = False
+        self.streamed = ""
+        self._text = text
+        self._chunk_size = chunk_size
+
+    async def __aiter__(self):
+        for i in range(0, len(self._text), self._chunk_size):
+            delta = self._text[i:i + self._chunk_size]
+            self.streamed += delta
+            yield SimpleNamespace(
+                usage=None,
+                choices=[SimpleNamespace(delta=SimpleNamespace(content=delta))],
+            )
+
+    async def close(self):
+        self.closed = True
+
+
 def test_build_system_prompt_default():
     """_build_system_prompt returns base + general cheatsheet."""
     from llm_client import _build_system_prompt, _BASE_PROMPT, _PROFILES
@@ -34,17 +59,147 @@ def test_available_models_has_entries():
     assert len(AVAILABLE_MODELS) >= 3
 
 
+@pytest.mark.asyncio
+async def test_concurrent_completions_are_capped():
+    """No more than AI_CAD_MAX_CONCURRENT completions are in flight."""
+    import asyncio
+
+    in_flight = peak = 0
+
+    async def slow_create(**kwargs):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return _Reply("result = Box(1, 1, 1)")
+
+    mock_client = MagicMock()
+    mock_client.chat.completions.create = slow_create
+
+    with patch.dict(os.environ, {"AI_CAD_MAX_CONCURRENT": "2"}):
+        client = LLMClient(api_key="test-key")
+    client._client = mock_client
+
+    codes = await asyncio.gather(*(client.generate(f"box {i}") for i in range(6)))
+    assert codes == ["result = Box(1, 1, 1)"] * 6
+    assert peak == 2
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_waits_for_token_budget():
+    """Once the per-minute token budget is spent, callers wait for refill."""
+    import time
+    from llm_client import _RateLimiter, _estimate_tokens
+
+    assert _estimate_tokens([
+        {"role": "system", "content": [{"type": "text", "text": "x" * 40}]},
+        {"role": "user", "content": "y" * 40},
+    ]) == 20
+
+    limiter = _RateLimiter(rpm=0, tpm=6000)  # refills 100 tokens/s
+    start = time.monotonic()
+    await limiter.acquire(6000)
+    assert time.monotonic() - start < 0.05
+    await limiter.acquire(10)
+    assert time.monotonic() - start >= 0.09
+
+
+@pytest.mark.asyncio
+async def test_generate_disk_cache_survives_restart(tmp_path):
+    """With AI_CAD_DISK_CACHE=1 a new client reuses code from the cache file."""
+    codes = []
+    for _ in range(2):
+        mock_client = MagicMock()
+        mock_client.chat.completions.create = AsyncMock(
+            return_value=_Reply("result = Box(1, 2, 3)")
+        )
+        with patch.dict(os.environ, {"AI_CAD_DISK_CACHE": "1"}), \
+             patch("llm_client._CODE_CACHE_PATH", tmp_path / "cache.db"):
+            client = LLMClient(api_key="test-key")
+        client._client = mock_client
+        codes.append(await client.generate("a 1x2x3 block"))
+        await client._code_cache.close()
+        calls = mock_client.chat.completions.create.call_count
+
+    assert codes == ["result = Box(1, 2, 3)"] * 2
+    assert calls == 0  # second client never hit the API
+
+
+@pytest.mark.asyncio
+async def test_pipeline_code_served_from_disk_cache(tmp_path):
+    """The pipeline's coder and review calls reuse the disk cache too."""
+    counts = []
+    for _ in range(2):
+        mock_client = MagicMock()
+        mock_client.chat.completions.create = AsyncMock(side_effect=[
+            _Reply("DESIGN: box"),
+            _Reply("result = Box(1, 2, 3)"),
+            _Reply("result = Box(1, 2, 3)"),
+        ])
+        with patch.dict(os.environ, {"AI_CAD_DISK_CACHE": "1"}), \
+             patch("llm_client._CODE_CACHE_PATH", tmp_path / "cache.db"):
+            client = LLMClient(api_key="test-key")
+        client._client = mock_client
+        code, _, _ = await client.generate_pipeline("a 1x2x3 block")
+        await client._code_cache.close()
+        counts.append(mock_client.chat.completions.create.call_count)
+        assert code == "result = Box(1, 2, 3)"
+
+    assert counts == [3, 1]  # only the design is requested again
+
+
+@pytest.mark.asyncio
+async def test_disk_cache_open_failure_is_retried(tmp_path):
+    """A failed cache open does not stick; the next call opens it again."""
+    with patch.dict(os.environ, {"AI_CAD_DISK_CACHE": "1"}), \
+         patch("llm_client._CODE_CACHE_PATH", tmp_path / "cache.db"):
+        client = LLMClient(api_key="test-key")
+    real_init = client._code_cache.init
+    client._code_cache.init = AsyncMock(side_effect=[OSError("locked"), None])
+
+    with pytest.raises(OSError):
+        await client._cached_code_db()
+    await real_init()
+    assert await client._cached_code_db() is client._code_cache
+    await client._code_cache.close()
+
+
+def test_import_does_not_load_build123d():
+    """Importing the client alone stays cheap; CAD is loaded on first execute."""
+    import subprocess
+    out = subprocess.run(
+        [sys.executable, "-c",
+         "import sys, llm_client; print('build123d' in sys.modules)"],
+        cwd=Path(__file__).parent.parent, capture_output=True, text=True, check=True,
+    )
+    assert out.stdout.strip() == "False"
+
+
 def test_default_model_exists():
     client = LLMClient(api_key="test-key")
     assert client.default_model in AVAILABLE_MODELS
 
 
+def test_client_keeps_connections_alive():
+    """Idle connections outlive the gap between pipeline stages."""
+    client = LLMClient(api_key="test-key")
+    pool = client._client._client._transport._pool
+    assert pool._keepalive_expiry == 60
+    assert client._client.timeout.read == 120
+
+
+@pytest.mark.asyncio
+async def test_close_shuts_http_pool():
+    client = LLMClient(api_key="test-key")
+    await client.close()
+    assert client._client.is_closed()
+
+
 @pytest.mark.asyncio
 async def test_generate_calls_openai_client():
     """Verify generate() calls the OpenAI-compatible API correctly."""
-    mock_response = MagicMock()
-    mock_response.choices = [MagicMock()]
-    mock_response.choices[0].message.content = 'result = Box(100, 50, 10)'
+    mock_response = _Reply('result = Box(100, 50, 10)')
 
     mock_client = MagicMock()
     mock_client.chat = MagicMock()
@@ -66,9 +221,7 @@ async def test_generate_calls_openai_client():
 @pytest.mark.asyncio
 async def test_generate_with_model_override():
     """Verify model parameter is passed through."""
-    mock_response = MagicMock()
-    mock_response.choices = [MagicMock()]
-    mock_response.choices[0].message.content = 'result = Cylinder(5, 10)'
+    mock_response = _Reply('result = Cylinder(5, 10)')
 
     mock_client = MagicMock()
     mock_client.chat = MagicMock()
@@ -87,9 +240,7 @@ async def test_generate_with_model_override():
 @pytest.mark.asyncio
 async def test_generate_strips_markdown_fences():
     """If LLM wraps code in ```python ... ```, strip it."""
-    mock_response = MagicMock()
-    mock_response.choices = [MagicMock()]
-    mock_response.choices[0].message.content = '```python\nresult = Box(10, 10, 10)\n```'
+    mock_response = _Reply('```python\nresult = Box(10, 10, 10)\n```')
 
     mock_client = MagicMock()
     mock_client.chat = MagicMock()
@@ -110,9 +261,7 @@ from nodes.ai_cad import CodeExecutionError
 @pytest.mark.asyncio
 async def test_generate_and_execute_success_first_try():
     """generate_and_execute returns on first successful execution."""
-    mock_response = MagicMock()
-    mock_response.choices = [MagicMock()]
-    mock_response.choices[0].message.content = "result = Box(100, 50, 10)"
+    mock_response = _Reply("result = Box(100, 50, 10)")
 
     mock_client = MagicMock()
     mock_client.chat = MagicMock()
@@ -134,13 +283,9 @@ async def test_generate_and_execute_success_first_try():
 @pytest.mark.asyncio
 async def test_generate_and_execute_retries_on_failure():
     """generate_and_execute retries when execution fails, then succeeds."""
-    bad_response = MagicMock()
-    bad_response.choices = [MagicMock()]
-    bad_response.choices[0].message.content = "x = Box(10, 10, 10)"  # missing result
+    bad_response = _Reply("x = Box(10, 10, 10)")  # missing result
 
-    good_response = MagicMock()
-    good_response.choices = [MagicMock()]
-    good_response.choices[0].message.content = "result = Box(10, 10, 10)"
+    good_response = _Reply("result = Box(10, 10, 10)")
 
     mock_client = MagicMock()
     mock_client.chat = MagicMock()
@@ -160,12 +305,146 @@ async def test_generate_and_execute_retries_on_failure():
     assert mock_client.chat.completions.create.call_count == 2
 
 
+@pytest.mark.asyncio
+async def test_generate_and_execute_speculative_retry():
+    """With speculation on, the retry is drafted while the first code runs."""
+    mock_client = MagicMock()
+    mock_client.chat.completions.create = AsyncMock(side_effect=[
+        _Reply("x = Box(10, 10, 10)"), _Reply("result = Box(10, 10, 10)"),
+    ])
+
+    client = LLMClient(api_key="test-key")
+    client._client = mock_client
+    client.speculative_retry = True
+
+    code, objects, _ = await client.generate_and_execute("Make a box")
+
+    assert code == "result = Box(10, 10, 10)"
+    assert len(objects) >= 1
+    draft_messages = mock_client.chat.completions.create.call_args[1]["messages"]
+    assert "may fail" in draft_messages[-1]["content"]
+
+
+@pytest.mark.asyncio
+async def test_pipeline_speculation_keeps_retries_error_aware():
+    """The pipeline fast-path flag does not switch retries to blind drafts."""
+    mock_client = MagicMock()
+    mock_client.chat.completions.create = AsyncMock(side_effect=[
+        _Reply("x = Box(10, 10, 10)"), _Reply("result = Box(10, 10, 10)"),
+    ])
+
+    client = LLMClient(api_key="test-key")
+    client._client = mock_client
+    client.speculative = True
+
+    code, _, _ = await client.generate_and_execute("Make a box")
+
+    assert code == "result = Box(10, 10, 10)"
+    retry_messages = mock_client.chat.completions.create.call_args[1]["messages"]
+    assert "may fail" not in retry_messages[-1]["content"]
+
+
+def test_retry_error_text_is_bounded():
+    """Long execution errors keep only their tail in retry prompts."""
+    from llm_client import _MAX_ERROR_CHARS, _error_text
+    assert _error_text(ValueError("short")) == "short"
+    long_error = ValueError("x" * 5000 + "NameError: Boxx")
+    text = _error_text(long_error)
+    assert len(text) == _MAX_ERROR_CHARS + 1
+    assert text.endswith("NameError: Boxx")
+
+
+@pytest.mark.asyncio
+async def test_generate_and_execute_caches_repeat_prompts():
+    """A repeated prompt is served from the client's result cache."""
+    mock_client = MagicMock()
+    mock_client.chat.completions.create = AsyncMock(
+        return_value=_Reply("result = Box(10, 10, 10)")
+    )
+
+    client = LLMClient(api_key="test-key")
+    client._client = mock_client
+
+    first = await client.generate_and_execute("Make a  box")
+    second = await client.generate_and_execute("make a box")
+    assert second is first
+    assert mock_client.chat.completions.create.call_count == 1
+
+    await client.generate_and_execute("Make a box", profile="2d")
+    assert mock_client.chat.completions.create.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_generate_and_execute_races_drafts():
+    """With speculative_k drafts, the first one that executes is returned."""
+    mock_client = MagicMock()
+    mock_client.chat.completions.create = AsyncMock(side_effect=[
+        _Reply("x = 42"), _Reply("result = Box(10, 10, 10)"), _Reply("x = 43"),
+    ])
+
+    client = LLMClient(api_key="test-key")
+    client._client = mock_client
+    client.speculative_k = 3
+
+    code, objects, _ = await client.generate_and_execute("Make a box")
+
+    assert code == "result = Box(10, 10, 10)"
+    assert len(objects) >= 1
+    assert mock_client.chat.completions.create.call_count == 3
+
+
+@pytest.mark.asyncio
+async def test_generate_and_execute_skips_failed_draft_requests():
+    """A draft whose API call fails does not abort the other drafts."""
+    mock_client = MagicMock()
+    mock_client.chat.completions.create = AsyncMock(side_effect=[
+        RuntimeError("429"), _Reply("result = Box(10, 10, 10)"), RuntimeError("timeout"),
+    ])
+
+    client = LLMClient(api_key="test-key")
+    client._client = mock_client
+    client.speculative_k = 3
+
+    code, objects, _ = await client.generate_and_execute("Make a box")
+
+    assert code == "result = Box(10, 10, 10)"
+    assert len(objects) >= 1
+
+
+@pytest.mark.asyncio
+async def test_generate_and_execute_failed_drafts_count_as_first_attempt():
+    """When every draft fails, the first retry carries the error and no draft reruns."""
+    from nodes import ai_cad
+
+    mock_client = MagicMock()
+    mock_client.chat.completions.create = AsyncMock(side_effect=[
+        _Reply("x = 1"), _Reply("x = 2"), _Reply("x = 3"),
+        _Reply("result = Box(10, 10, 10)"),
+    ])
+
+    client = LLMClient(api_key="test-key")
+    client._client = mock_client
+    client.speculative_k = 3
+    client.max_retries = 1
+
+    with patch.object(
+        ai_cad, "execute_build123d_code", wraps=ai_cad.execute_build123d_code,
+    ) as execute:
+        code, _, _ = await client.generate_and_execute("Make a box")
+
+    assert code == "result = Box(10, 10, 10)"
+    # Three drafts plus the one retry; no failed draft is executed twice
+    assert execute.call_count == 4
+    assert mock_client.chat.completions.create.call_count == 4
+    retry_messages = mock_client.chat.completions.create.call_args[1]["messages"]
+    assert retry_messages[-2]["content"] in ("x = 1", "x = 2", "x = 3")
+    assert retry_messages[-1]["content"].startswith("Your code produced an error")
+
+
 @pytest.mark.asyncio
 async def test_generate_and_execute_exhausts_retries():
     """generate_and_execute raises after exhausting retries."""
-    bad_response = MagicMock()
-    bad_response.choices = [MagicMock()]
-    bad_response.choices[0].message.content = "x = 42"  # always bad
+    bad_response = _Reply("x = 42")  # always bad
 
     mock_client = MagicMock()
     mock_client.chat = MagicMock()
@@ -186,9 +465,7 @@ async def test_generate_and_execute_exhausts_retries():
 @pytest.mark.asyncio
 async def test_generate_and_execute_zero_retries():
     """With max_retries=0, no retry is attempted."""
-    bad_response = MagicMock()
-    bad_response.choices = [MagicMock()]
-    bad_response.choices[0].message.content = "x = 42"
+    bad_response = _Reply("x = 42")
 
     mock_client = MagicMock()
     mock_client.chat = MagicMock()
@@ -207,9 +484,7 @@ async def test_generate_and_execute_zero_retries():
 @pytest.mark.asyncio
 async def test_generate_uses_profile():
     """generate() uses the specified profile's cheatsheet."""
-    mock_response = MagicMock()
-    mock_response.choices = [MagicMock()]
-    mock_response.choices[0].message.content = "result = Box(10, 10, 10)"
+    mock_response = _Reply("result = Box(10, 10, 10)")
 
     mock_client = MagicMock()
     mock_client.chat = MagicMock()
@@ -222,10 +497,68 @@ async def test_generate_uses_profile():
     await client.generate("Make a box", profile="2d")
 
     call_kwargs = mock_client.chat.completions.create.call_args[1]
-    system_msg = call_kwargs["messages"][0]["content"]
+    system_msg = call_kwargs["messages"][0]["content"][0]["text"]
     assert "2D" in system_msg
 
 
+def test_system_message_marked_for_prompt_caching():
+    """System prompt is one cached text block, shared between calls."""
+    from llm_client import _system_message
+    msg = _system_message("2d")
+    assert msg["role"] == "system"
+    assert msg["content"][0]["cache_control"] == {"type": "ephemeral"}
+    assert "2D" in msg["content"][0]["text"]
+    assert _system_message("2d") is msg
+
+
+@pytest.mark.asyncio
+async def test_generate_bytes_sends_data_url():
+    """generate_bytes() encodes raw image bytes into a data URL."""
+    mock_response = _Reply("result = Box(10, 10, 10)")
+
+    mock_client = MagicMock()
+    mock_client.chat = MagicMock()
+    mock_client.chat.completions = MagicMock()
+    mock_client.chat.completions.create = AsyncMock(return_value=mock_response)
+
+    client = LLMClient(api_key="test-key")
+    client._client = mock_client
+
+    await client.generate_bytes("box", b"\x89PNG", model="google/gemini-2.5-flash-lite")
+
+    user_content = mock_client.chat.completions.create.call_args[1]["messages"][1]["content"]
+    assert user_content[1]["image_url"]["url"] == "data:image/png;base64,iVBORw=="
+
+
+def test_strip_code_fences():
+    """Fence stripping takes the first block and drops a python tag."""
+    from llm_client import _strip_code_fences
+    assert _strip_code_fences("  x = 1\n") == "x = 1"
+    assert _strip_code_fences("```python\nx = 1\n```") == "x = 1"
+    assert _strip_code_fences("Here:\n```\nx = 1\n```\nDone") == "x = 1"
+    assert _strip_code_fences("```python x = 1```") == "x = 1"
+    assert _strip_code_fences("```python\nx = 1") == "```python\nx = 1"
+
+
+@pytest.mark.asyncio
+async def test_code_stream_stops_at_closing_fence():
+    """The coder stream is closed once the code block ends."""
+    reply = _Reply(
+        "```python\nresult = Box(1, 1, 1)\n```\n" + "Explanation. " * 50
+    )
+    mock_client = MagicMock()
+    mock_client.chat.completions.create = AsyncMock(return_value=reply)
+
+    client = LLMClient(api_key="test-key")
+    client._client = mock_client
+    code = await client.refine_code("result = Box(2, 2, 2)", "smaller", [])
+
+    assert code == "result = Box(1, 1, 1)"
+    assert reply.closed
+    assert "Explanation" not in reply.streamed
+    assert mock_client.chat.completions.create.call_args[1]["stream"] is True
+
+
 def test_2d_profile_has_patterns():
     """2D profile includes text, sheet material, and outline keywords."""
     from llm_client import _build_system_prompt
@@ -277,6 +610,17 @@ result = bp.part
     assert len(objects) >= 1
 
 
+def test_system_message_unknown_profiles_share_general():
+    """Unknown profile names reuse the general message instead of growing the cache."""
+    from llm_client import _SYSTEM_MESSAGES, _system_message
+
+    general = _system_message("general")
+    size = len(_SYSTEM_MESSAGES)
+    for i in range(5):
+        assert _system_message(f"no-such-profile-{i}") is general
+    assert len(_SYSTEM_MESSAGES) == size
+
+
 def test_load_reference_file_returns_content(tmp_path):
     """_load_reference_file reads content from file."""
     from llm_client import _load_reference_file, _REFERENCE_CACHE
@@ -314,8 +658,9 @@ def test_load_reference_file_missing_returns_empty():
 
 def test_build_system_prompt_with_reference(tmp_path):
     """_build_system_prompt includes reference content when include_reference=True."""
-    from llm_client import _build_system_prompt, _REFERENCE_CACHE, _REF_PATHS
+    from llm_client import _build_system_prompt, _REFERENCE_CACHE, _SYSTEM_MESSAGES, _REF_PATHS
     _REFERENCE_CACHE.clear()
+    _SYSTEM_MESSAGES.clear()
     # Create temp reference files
     api_ref = tmp_path / "build123d_api_reference.md"
     api_ref.write_text("# API Reference\nBox(length, width, height)")
@@ -331,9 +676,34 @@ def test_build_system_prompt_with_reference(tmp_path):
         assert "Examples" in prompt
         assert "CODE EXAMPLES" in prompt
         assert "API REFERENCE" in prompt
+        # Shared reference before the per-profile cheatsheet
+        other = _build_system_prompt("2d", include_reference=True)
+        shared = prompt.index("═══ QUICK REFERENCE ═══")
+        assert shared > prompt.index("API Reference")
+        assert other[:shared] == prompt[:shared]
     finally:
         _REF_PATHS.update(original_paths)
         _REFERENCE_CACHE.clear()
+        _SYSTEM_MESSAGES.clear()
+
+
+@pytest.mark.asyncio
+async def test_small_context_model_gets_compact_cheatsheet():
+    """Models without large context get the cheatsheet minus its PATTERNS."""
+    from llm_client import _build_system_prompt
+
+    compact = _build_system_prompt("2d", compact=True)
+    assert "PITFALLS" in compact
+    assert "PATTERNS" not in compact
+    assert len(compact) < len(_build_system_prompt("2d"))
+
+    mock_client = MagicMock()
+    mock_client.chat.completions.create = AsyncMock(return_value=_Reply("result = 1"))
+    client = LLMClient(api_key="test-key")
+    client._client = mock_client
+    await client.generate("box", model="deepseek/deepseek-r1", profile="2d")
+    system = mock_client.chat.completions.create.call_args[1]["messages"][0]
+    assert system["content"][0]["text"] == compact
 
 
 def test_build_system_prompt_without_reference():
@@ -377,8 +747,9 @@ def test_model_has_large_context_helper():
 @pytest.mark.asyncio
 async def test_generate_includes_reference_for_large_context_model(tmp_path):
     """generate() includes reference for large_context models."""
-    from llm_client import _REFERENCE_CACHE, _REF_PATHS
+    from llm_client import _REFERENCE_CACHE, _SYSTEM_MESSAGES, _REF_PATHS
     _REFERENCE_CACHE.clear()
+    _SYSTEM_MESSAGES.clear()
     # Create temp reference files
     api_ref = tmp_path / "build123d_api_reference.md"
     api_ref.write_text("UNIQUE_API_MARKER_12345")
@@ -388,9 +759,7 @@ async def test_generate_includes_reference_for_large_context_model(tmp_path):
     _REF_PATHS["api_reference"] = str(api_ref)
     _REF_PATHS["examples"] = str(examples)
 
-    mock_response = MagicMock()
-    mock_response.choices = [MagicMock()]
-    mock_response.choices[0].message.content = "result = Box(10, 10, 10)"
+    mock_response = _Reply("result = Box(10, 10, 10)")
 
     mock_client = MagicMock()
     mock_client.chat = MagicMock()
@@ -402,21 +771,37 @@ async def test_generate_includes_reference_for_large_context_model(tmp_path):
 
     try:
         # Flash Lite is large_context=True
-        await client.generate("box", model="google/gemini-2.5-flash-lite")
+        await client.generate("loft a vase", model="google/gemini-2.5-flash-lite")
         call_kwargs = mock_client.chat.completions.create.call_args[1]
-        system_msg = call_kwargs["messages"][0]["content"]
+        system_msg = call_kwargs["messages"][0]["content"][0]["text"]
         assert "UNIQUE_API_MARKER_12345" in system_msg
         assert "UNIQUE_EXAMPLES_MARKER_67890" in system_msg
+
+        # A trivial prompt skips it unless forced
+        await client.generate("box", model="google/gemini-2.5-flash-lite")
+        call_kwargs = mock_client.chat.completions.create.call_args[1]
+        system_msg = call_kwargs["messages"][0]["content"][0]["text"]
+        assert "UNIQUE_API_MARKER_12345" not in system_msg
+        assert "PATTERNS" in system_msg
+
+        await client.generate(
+            "box", model="google/gemini-2.5-flash-lite", include_reference=True,
+        )
+        call_kwargs = mock_client.chat.completions.create.call_args[1]
+        system_msg = call_kwargs["messages"][0]["content"][0]["text"]
+        assert "UNIQUE_API_MARKER_12345" in system_msg
     finally:
         _REF_PATHS.update(original_paths)
         _REFERENCE_CACHE.clear()
+        _SYSTEM_MESSAGES.clear()
 
 
 @pytest.mark.asyncio
 async def test_generate_excludes_reference_for_small_context_model(tmp_path):
     """generate() excludes reference for non-large_context models."""
-    from llm_client import _REFERENCE_CACHE, _REF_PATHS
+    from llm_client import _REFERENCE_CACHE, _SYSTEM_MESSAGES, _REF_PATHS
     _REFERENCE_CACHE.clear()
+    _SYSTEM_MESSAGES.clear()
     api_ref = tmp_path / "build123d_api_reference.md"
     api_ref.write_text("UNIQUE_API_MARKER_12345")
     examples = tmp_path / "build123d_examples.md"
@@ -425,9 +810,7 @@ async def test_generate_excludes_reference_for_small_context_model(tmp_path):
     _REF_PATHS["api_reference"] = str(api_ref)
     _REF_PATHS["examples"] = str(examples)
 
-    mock_response = MagicMock()
-    mock_response.choices = [MagicMock()]
-    mock_response.choices[0].message.content = "result = Box(10, 10, 10)"
+    mock_response = _Reply("result = Box(10, 10, 10)")
 
     mock_client = MagicMock()
     mock_client.chat = MagicMock()
@@ -441,20 +824,19 @@ async def test_generate_excludes_reference_for_small_context_model(tmp_path):
         # DeepSeek R1 is large_context=False
         await client.generate("box", model="deepseek/deepseek-r1")
         call_kwargs = mock_client.chat.completions.create.call_args[1]
-        system_msg = call_kwargs["messages"][0]["content"]
+        system_msg = call_kwargs["messages"][0]["content"][0]["text"]
         assert "UNIQUE_API_MARKER_12345" not in system_msg
         assert "UNIQUE_EXAMPLES_MARKER_67890" not in system_msg
     finally:
         _REF_PATHS.update(original_paths)
         _REFERENCE_CACHE.clear()
+        _SYSTEM_MESSAGES.clear()
 
 
 @pytest.mark.asyncio
 async def test_design_with_context_calls_designer_model():
     """_design_with_context calls Gemini with full reference."""
-    mock_response = MagicMock()
-    mock_response.choices = [MagicMock()]
-    mock_response.choices[0].message.content = "DESIGN: box from 6 panels\nAPPROACH: Builder API"
+    mock_response = _Reply("DESIGN: box from 6 panels\nAPPROACH: Builder API")
 
     mock_client = MagicMock()
     mock_client.chat.completions.create = AsyncMock(return_value=mock_response)
@@ -472,9 +854,7 @@ async def test_design_with_context_calls_designer_model():
 @pytest.mark.asyncio
 async def test_generate_code_calls_coder_model():
     """_generate_code calls Qwen3 Coder with design context."""
-    mock_response = MagicMock()
-    mock_response.choices = [MagicMock()]
-    mock_response.choices[0].message.content = "result = Box(100, 50, 10)"
+    mock_response = _Reply("result = Box(100, 50, 10)")
 
     mock_client = MagicMock()
     mock_client.chat.completions.create = AsyncMock(return_value=mock_response)
@@ -493,9 +873,7 @@ async def test_generate_code_calls_coder_model():
 @pytest.mark.asyncio
 async def test_self_review_calls_coder_model():
     """_self_review sends code back to Qwen3 for review."""
-    mock_response = MagicMock()
-    mock_response.choices = [MagicMock()]
-    mock_response.choices[0].message.content = "result = Box(100, 100, 100)"
+    mock_response = _Reply("result = Box(100, 100, 100)")
 
     mock_client = MagicMock()
     mock_client.chat.completions.create = AsyncMock(return_value=mock_response)
@@ -509,24 +887,37 @@ async def test_self_review_calls_coder_model():
     call_kwargs = mock_client.chat.completions.create.call_args[1]
     assert call_kwargs["model"] == "qwen/qwen3-coder-next"
     # System message should contain review instructions
-    system_msg = call_kwargs["messages"][0]["content"]
+    system_msg = call_kwargs["messages"][0]["content"][0]["text"]
     assert "build123d" in system_msg.lower() or "review" in str(call_kwargs["messages"]).lower()
 
 
+@pytest.mark.asyncio
+async def test_coder_stages_share_system_prefix():
+    """Coding and review send the same system message, so its cache is reused."""
+    mock_response = _Reply("result = Box(1, 1, 1)")
+
+    mock_client = MagicMock()
+    mock_client.chat.completions.create = AsyncMock(return_value=mock_response)
+
+    client = LLMClient(api_key="test-key")
+    client._client = mock_client
+
+    await client._generate_code("box", "DESIGN: box")
+    await client._self_review("box", "result = Box(1, 1, 1)")
+
+    calls = mock_client.chat.completions.create.call_args_list
+    assert calls[0][1]["messages"][0] == calls[1][1]["messages"][0]
+    assert calls[0][1]["extra_body"] == {"usage": {"include": True}}
+
+
 @pytest.mark.asyncio
 async def test_generate_pipeline_success():
     """generate_pipeline runs all stages and returns result."""
-    design_response = MagicMock()
-    design_response.choices = [MagicMock()]
-    design_response.choices[0].message.content = "DESIGN: single box"
+    design_response = _Reply("DESIGN: single box")
 
-    code_response = MagicMock()
-    code_response.choices = [MagicMock()]
-    code_response.choices[0].message.content = "result = Box(100, 50, 10)"
+    code_response = _Reply("result = Box(100, 50, 10)")
 
-    review_response = MagicMock()
-    review_response.choices = [MagicMock()]
-    review_response.choices[0].message.content = "result = Box(100, 50, 10)"
+    review_response = _Reply("result = Box(100, 50, 10)")
 
     mock_client = MagicMock()
     mock_client.chat.completions.create = AsyncMock(
@@ -552,28 +943,121 @@ async def test_generate_pipeline_success():
     assert mock_client.chat.completions.create.call_count == 3
 
 
+@pytest.mark.asyncio
+async def test_generate_pipeline_sends_image_to_designer_once():
+    """A sketch image reaches the designer and is not resent to the coder."""
+    mock_client = MagicMock()
+    mock_client.chat.completions.create = AsyncMock(side_effect=[
+        _Reply("DESIGN: single box"),
+        _Reply("result = Box(10, 10, 10)"),
+        _Reply("result = Box(10, 10, 10)"),
+    ])
+
+    client = LLMClient(api_key="test-key")
+    client._client = mock_client
+    client.speculative = True
+
+    await client.generate_pipeline(
+        "Make this", image_base64="data:image/png;base64,AAAA",
+    )
+
+    calls = mock_client.chat.completions.create.call_args_list
+    assert len(calls) == 3
+    design_content = calls[0][1]["messages"][-1]["content"]
+    assert design_content[1]["image_url"]["url"] == "data:image/png;base64,AAAA"
+    assert all(isinstance(c[1]["messages"][-1]["content"], str) for c in calls[1:])
+
+
+@pytest.mark.asyncio
+async def test_generate_pipeline_fused():
+    """Fused mode gets design and code from one call and skips the review."""
+    mock_client = MagicMock()
+    mock_client.chat.completions.create = AsyncMock(return_value=_Reply(
+        "<design>one box, 100x50x10</design>\n"
+        "```python\nresult = Box(100, 50, 10)\n```"
+    ))
+
+    client = LLMClient(api_key="test-key")
+    client._client = mock_client
+
+    stages, details = [], {}
+    async def on_stage(stage: str):
+        stages.append(stage)
+    async def on_detail(key: str, value: str):
+        details[key] = value
+
+    code, objects, _ = await client.generate_pipeline(
+        "Make a box 100x50x10mm", on_stage=on_stage, on_detail=on_detail,
+        fused=True,
+    )
+
+    assert code == "result = Box(100, 50, 10)"
+    assert len(objects) >= 1
+    assert details["design"] == "one box, 100x50x10"
+    assert stages == ["coding", "executing"]
+    assert mock_client.chat.completions.create.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_generate_pipeline_speculative_fast_path():
+    """With speculation on, working design-less code is returned without review."""
+    fast_response = _Reply("result = Box(10, 10, 10)")
+
+    design_response = _Reply("DESIGN: unused")
+
+    mock_client = MagicMock()
+    mock_client.chat.completions.create = AsyncMock(
+        side_effect=[fast_response, design_response]
+    )
+
+    client = LLMClient(api_key="test-key")
+    client._client = mock_client
+    client.speculative = True
+
+    stages = []
+    async def on_stage(stage: str):
+        stages.append(stage)
+
+    code, objects, step_bytes = await client.generate_pipeline(
+        "Make a 10mm cube", on_stage=on_stage,
+    )
+
+    assert code == "result = Box(10, 10, 10)"
+    assert len(objects) == 1
+    assert mock_client.chat.completions.create.call_count <= 2
+    assert stages == ["designing", "coding"]
+
+
+@pytest.mark.asyncio
+async def test_generate_pipeline_fast_path_request_failure_falls_back():
+    """A failing fast-path coder call leaves the design path to finish the job."""
+    client = LLMClient(api_key="test-key")
+    client.speculative = True
+    client._design_with_context = AsyncMock(return_value="DESIGN: box")
+    client._generate_code = AsyncMock(side_effect=[
+        RuntimeError("429 Too Many Requests"), "result = Box(10, 10, 10)",
+    ])
+    client._self_review = AsyncMock(return_value="result = Box(10, 10, 10)")
+
+    code, objects, _ = await client.generate_pipeline("Make a 10mm cube")
+
+    assert code == "result = Box(10, 10, 10)"
+    assert len(objects) == 1
+    assert client._generate_code.call_count == 2
+
+
 @pytest.mark.asyncio
 async def test_generate_pipeline_retries_with_gemini():
     """On execution error, pipeline re-queries Gemini then Qwen."""
-    design_response = MagicMock()
-    design_response.choices = [MagicMock()]
-    design_response.choices[0].message.content = "DESIGN: box"
+    design_response = _Reply("DESIGN: box")
 
-    bad_code_response = MagicMock()
-    bad_code_response.choices = [MagicMock()]
-    bad_code_response.choices[0].message.content = "x = Box(100, 50, 10)"  # missing result
+    bad_code_response = _Reply("x = Box(100, 50, 10)")  # missing result
 
-    review_response = MagicMock()
-    review_response.choices = [MagicMock()]
-    review_response.choices[0].message.content = "x = Box(100, 50, 10)"  # still bad
+    review_response = _Reply("x = Box(100, 50, 10)")  # still bad
 
-    retry_design_response = MagicMock()
-    retry_design_response.choices = [MagicMock()]
-    retry_design_response.choices[0].message.content = "DESIGN: assign to result"
+    retry_design_response = _Reply("DESIGN: assign to result")
 
-    good_code_response = MagicMock()
-    good_code_response.choices = [MagicMock()]
-    good_code_response.choices[0].message.content = "result = Box(100, 50, 10)"
+    good_code_response = _Reply("result = Box(100, 50, 10)")
 
     mock_client = MagicMock()
     mock_client.chat.completions.create = AsyncMock(
@@ -653,8 +1137,9 @@ def test_ai_cad_generate_sse_streams_stages():
 @pytest.mark.asyncio
 async def test_refine_code_includes_reference(tmp_path):
     """refine_code() includes full API reference in system prompt."""
-    from llm_client import _REFERENCE_CACHE, _REF_PATHS
+    from llm_client import _REFERENCE_CACHE, _SYSTEM_MESSAGES, _REF_PATHS
     _REFERENCE_CACHE.clear()
+    _SYSTEM_MESSAGES.clear()
     api_ref = tmp_path / "build123d_api_reference.md"
     api_ref.write_text("REFINE_API_MARKER")
     examples = tmp_path / "build123d_examples.md"
@@ -663,9 +1148,7 @@ async def test_refine_code_includes_reference(tmp_path):
     _REF_PATHS["api_reference"] = str(api_ref)
     _REF_PATHS["examples"] = str(examples)
 
-    mock_response = MagicMock()
-    mock_response.choices = [MagicMock()]
-    mock_response.choices[0].message.content = "result = Box(100, 50, 20)"
+    mock_response = _Reply("result = Box(100, 50, 20)")
 
     mock_client = MagicMock()
     mock_client.chat.completions.create = AsyncMock(return_value=mock_response)
@@ -680,19 +1163,21 @@ async def test_refine_code_includes_reference(tmp_path):
             history=[],
         )
         call_kwargs = mock_client.chat.completions.create.call_args[1]
-        system_msg = call_kwargs["messages"][0]["content"]
+        system_msg = call_kwargs["messages"][0]["content"][0]["text"]
         assert "REFINE_API_MARKER" in system_msg
         assert "REFINE_EXAMPLES_MARKER" in system_msg
     finally:
         _REF_PATHS.update(original_paths)
         _REFERENCE_CACHE.clear()
+        _SYSTEM_MESSAGES.clear()
 
 
 @pytest.mark.asyncio
 async def test_self_review_includes_reference(tmp_path):
     """_self_review() includes full API reference in system prompt."""
-    from llm_client import _REFERENCE_CACHE, _REF_PATHS
+    from llm_client import _REFERENCE_CACHE, _SYSTEM_MESSAGES, _REF_PATHS
     _REFERENCE_CACHE.clear()
+    _SYSTEM_MESSAGES.clear()
     api_ref = tmp_path / "build123d_api_reference.md"
     api_ref.write_text("REVIEW_API_MARKER")
     examples = tmp_path / "build123d_examples.md"
@@ -701,9 +1186,7 @@ async def test_self_review_includes_reference(tmp_path):
     _REF_PATHS["api_reference"] = str(api_ref)
     _REF_PATHS["examples"] = str(examples)
 
-    mock_response = MagicMock()
-    mock_response.choices = [MagicMock()]
-    mock_response.choices[0].message.content = "result = Box(100, 100, 100)"
+    mock_response = _Reply("result = Box(100, 100, 100)")
 
     mock_client = MagicMock()
     mock_client.chat.completions.create = AsyncMock(return_value=mock_response)
@@ -714,12 +1197,13 @@ async def test_self_review_includes_reference(tmp_path):
     try:
         await client._self_review("box", "result = Box(100,100,100)")
         call_kwargs = mock_client.chat.completions.create.call_args[1]
-        system_msg = call_kwargs["messages"][0]["content"]
+        system_msg = call_kwargs["messages"][0]["content"][0]["text"]
         assert "REVIEW_API_MARKER" in system_msg
         assert "REVIEW_EXAMPLES_MARKER" in system_msg
     finally:
         _REF_PATHS.update(original_paths)
         _REFERENCE_CACHE.clear()
+        _SYSTEM_MESSAGES.clear()
 
 
 def test_list_profiles_info():
@@ -138,3 +138,31 @@ def test_validate_settings_depth_exceeds_total():
     assert res.status_code == 200
     data = res.json()
     assert any("深さ" in w for w in data["warnings"])
+
+
+def test_get_presets_reparsed_only_when_file_changes(tmp_path, monkeypatch):
+    """Presets are cached until materials.yaml is modified."""
+    import json
+    import os
+
+    import main
+
+    yaml_path = tmp_path / "materials.yaml"
+    yaml_path.write_text((main.PRESETS_DIR / "materials.yaml").read_text())
+    monkeypatch.setattr(main, "PRESETS_DIR", tmp_path)
+    monkeypatch.setattr(main, "_presets_cache", None)
+
+    body = client.get("/api/presets").content
+    first = main._presets_cache
+    assert client.get("/api/presets").content == body
+    assert main._presets_cache is first
+    # Same document the response_model path produced
+    assert json.loads(body) == [
+        p.model_dump(mode="json")
+        for p in main._PRESET_LIST.validate_json(body)
+    ]
+
+    st = yaml_path.stat()
+    yaml_path.write_text("presets: []\n")
+    os.utime(yaml_path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+    assert client.get("/api/presets").json() == []
@@ -95,6 +95,18 @@ class TestAutoNesting:
         assert result[0].x_offset == 0
         assert result[0].y_offset == 0
 
+    def test_part_nests_into_l_shape_notch(self):
+        """非矩形の外形どうしは切り欠きに入り込める（BB同士は重なる）"""
+        big = _make_object("obj_l", 300, 200)
+        big.outline = [[0, 0], [300, 0], [300, 60], [100, 60], [100, 200], [0, 200], [0, 0]]
+        small = _make_object("obj_s", 150, 100)
+        result = auto_nesting([big, small], _make_sheet(400, 400), tool_diameter=0, clearance=0)
+        by_id = {p.object_id: p for p in result}
+        assert {p.sheet_id for p in result} == {"sheet_1"}
+        assert by_id["obj_l"].x_offset == 0 and by_id["obj_l"].y_offset == 0
+        # 接触も干渉扱いなので1グリッド(5mm)離れた位置
+        assert (by_id["obj_s"].x_offset, by_id["obj_s"].y_offset) == (105, 65)
+
 
 def _bbs_overlap(
     p1: PlacementItem, w1: float, h1: float,
@@ -39,3 +39,18 @@ def test_placement_out_of_bounds():
     warnings = _validate_placement(placement, sheet, bb)
     assert len(warnings) > 0
     assert "X" in warnings[0]
+
+
+def test_out_of_bounds_mask_matches_scalar_check():
+    """The bulk mask flags exactly the placements that produce warnings."""
+    from main import _out_of_bounds_mask, _validate_placement
+    sheet = SheetMaterial(material_id="mtl_1", width=600, depth=400, thickness=18)
+    bb = BoundingBox(x=100, y=50, z=10)
+    checked = [
+        (PlacementItem(object_id=f"obj_{i}", material_id="mtl_1", x_offset=x, y_offset=y), sheet, bb)
+        for i, (x, y) in enumerate([(10, 10), (550, 10), (10, 360), (-1, 10), (10, -1), (500, 350)])
+    ]
+    mask = _out_of_bounds_mask(checked)
+    assert mask.tolist() == [bool(_validate_placement(*c)) for c in checked]
+    assert mask.tolist() == [False, True, True, True, True, False]
+    assert _out_of_bounds_mask([]).tolist() == []
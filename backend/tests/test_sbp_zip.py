@@ -130,3 +130,14 @@ def test_generate_sbp_zip_content_disposition():
     body = _make_zip_request(["sheet_1"])
     resp = client.post("/api/generate-sbp-zip", json=body)
     assert "pathdesigner_sheets.zip" in resp.headers.get("content-disposition", "")
+
+
+def test_generate_sbp_zip_skips_sheet_without_operations():
+    """A sheet whose parts have no assigned operations gets no .sbp file."""
+    body = _make_zip_request(["sheet_1", "sheet_2"])
+    body["operations"] = body["operations"][:1]
+    resp = client.post("/api/generate-sbp-zip", json=body)
+    assert resp.status_code == 200
+
+    zf = zipfile.ZipFile(io.BytesIO(resp.content))
+    assert zf.namelist() == ["sheet_1.sbp"]
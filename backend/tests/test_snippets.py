@@ -1,4 +1,5 @@
 """Tests for SnippetsDB and /snippets endpoints."""
+import base64
 import json
 import pytest
 import pytest_asyncio
@@ -56,6 +57,132 @@ async def test_list_snippets_search(snippets_db: SnippetsDB):
     assert rows[0]["name"] == "Simple Box"
 
 
+@pytest.mark.asyncio
+async def test_list_snippets_total_spans_pages(snippets_db: SnippetsDB):
+    for i in range(3):
+        await snippets_db.save_snippet(name=f"Part {i}", code="result = Box(1,1,1)")
+    rows, total = await snippets_db.list_snippets(limit=2)
+    assert total == 3
+    assert len(rows) == 2
+    assert "_total" not in rows[0]
+    rows, total = await snippets_db.list_snippets(limit=2, offset=5)
+    assert rows == []
+    assert total == 3
+
+
+@pytest.mark.asyncio
+async def test_save_snippets_many(snippets_db: SnippetsDB):
+    ids = await snippets_db.save_snippets_many([
+        {"name": f"Part {i}", "code": f"result = Box({i}, 1, 1)", "tags": ["bulk"]}
+        for i in range(200)
+    ])
+    assert len(set(ids)) == 200
+    rows, total = await snippets_db.list_snippets(q="Part 19")
+    assert total == 11  # "Part 19" and "Part 190".."Part 199"
+    row = await snippets_db.get_snippet(ids[0])
+    assert json.loads(row["tags"]) == ["bulk"]
+    assert await snippets_db.save_snippets_many([]) == []
+
+
+@pytest.mark.asyncio
+async def test_list_snippets_cursor_pages(snippets_db: SnippetsDB):
+    await snippets_db.save_snippets_many(
+        [{"name": f"Bracket {i}", "code": "pass"} for i in range(5)]
+    )
+    first, total = await snippets_db.list_snippets(q="Bracket", limit=3)
+    last = first[-1]
+    rest, rest_total = await snippets_db.list_snippets(
+        q="Bracket", limit=3, cursor=(last["created_at"], last["id"])
+    )
+    assert total == rest_total == 5
+    assert len(rest) == 2
+    assert {r["id"] for r in first}.isdisjoint(r["id"] for r in rest)
+    end = rest[-1]
+    rows, end_total = await snippets_db.list_snippets(
+        q="Bracket", cursor=(end["created_at"], end["id"])
+    )
+    assert rows == [] and end_total == 5
+
+
+@pytest.mark.asyncio
+async def test_list_snippets_json_matches_rows(snippets_db: SnippetsDB):
+    await snippets_db.save_snippets_many(
+        [{"name": f"Flange {i}", "code": "pass", "tags": ["f"]} for i in range(3)]
+    )
+    rows, total = await snippets_db.list_snippets(limit=2)
+    doc = json.loads(await snippets_db.list_snippets_json(limit=2))
+    assert doc["total"] == total == 3
+    assert [s["id"] for s in doc["snippets"]] == [r["id"] for r in rows]
+    assert doc["snippets"][0]["tags"] == ["f"]
+    assert doc["next_cursor"] == f"{rows[-1]['created_at']},{rows[-1]['id']}"
+    empty = json.loads(await snippets_db.list_snippets_json(q="nothing"))
+    assert empty == {"snippets": [], "total": 0, "next_cursor": None}
+
+
+@pytest.mark.asyncio
+async def test_list_snippets_by_tags(snippets_db: SnippetsDB):
+    both = await snippets_db.save_snippet(name="A", code="pass", tags=["jig", "plywood"])
+    await snippets_db.save_snippet(name="B", code="pass", tags=["jig"])
+    await snippets_db.save_snippet(name="C", code="pass")
+    rows, total = await snippets_db.list_snippets(tags=["jig"])
+    assert total == 2
+    rows, total = await snippets_db.list_snippets(tags=["plywood", "jig", "jig"])
+    assert [r["id"] for r in rows] == [both] and total == 1
+    doc = json.loads(await snippets_db.list_snippets_json(q="A", tags=["jig"]))
+    assert [s["id"] for s in doc["snippets"]] == [both]
+    await snippets_db.delete_snippet(both)
+    assert await snippets_db.list_snippets(tags=["plywood"]) == ([], 0)
+
+
+@pytest.mark.asyncio
+async def test_thumbnail_stored_as_blob(snippets_db: SnippetsDB):
+    png = b"\x89PNG\r\n\x1a\nfake"
+    data_url = "data:image/png;base64," + base64.b64encode(png).decode()
+    sid = await snippets_db.save_snippet(name="Thumb", code="pass", thumbnail_png=data_url)
+    plain = await snippets_db.save_snippet(name="Plain", code="pass")
+    assert await snippets_db.get_snippet_thumbnail(sid) == png
+    assert await snippets_db.get_snippet_thumbnail(plain) is None
+    doc = json.loads(await snippets_db.list_snippets_json())
+    urls = {s["id"]: s["thumbnail_url"] for s in doc["snippets"]}
+    assert urls == {sid: f"/snippets/{sid}/thumbnail", plain: None}
+    await snippets_db.delete_snippet(sid)
+    assert await snippets_db.get_snippet_thumbnail(sid) is None
+
+
+@pytest.mark.asyncio
+async def test_inline_thumbnails_migrated(tmp_path: Path):
+    import sqlite3
+
+    path = tmp_path / "legacy.db"
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE snippets (id TEXT PRIMARY KEY, name TEXT NOT NULL, tags TEXT,"
+        " code TEXT NOT NULL, thumbnail_png TEXT, source_generation_id TEXT,"
+        " created_at TEXT NOT NULL, updated_at TEXT NOT NULL)"
+    )
+    conn.execute(
+        "INSERT INTO snippets VALUES ('old', 'Old', '[]', 'pass', ?, NULL, 't', 't')",
+        ("data:image/png;base64," + base64.b64encode(b"png").decode(),),
+    )
+    conn.execute(
+        "INSERT INTO snippets VALUES ('bad', 'Bad', '[]', 'pass', ?, NULL, 't', 't')",
+        ("data:image/png;base64,not-base64!!",),
+    )
+    conn.commit()
+    conn.close()
+
+    legacy = SnippetsDB(path)
+    await legacy.init()
+    try:
+        assert await legacy.get_snippet_thumbnail("old") == b"png"
+        assert (await legacy.get_snippet("old"))["has_thumbnail"]
+        # A malformed legacy thumbnail is dropped; the snippet itself survives
+        assert await legacy.get_snippet_thumbnail("bad") is None
+        assert not (await legacy.get_snippet("bad"))["has_thumbnail"]
+    finally:
+        await legacy.close()
+
+
 @pytest.mark.asyncio
 async def test_delete_snippet(snippets_db: SnippetsDB):
     sid = await snippets_db.save_snippet(name="Temp", code="result = Box(1,1,1)")
@@ -106,6 +233,21 @@ def test_post_snippet(client: TestClient):
     assert data["id"] is not None
 
 
+def test_post_snippet_non_ascii_thumbnail_rejected(tmp_path: Path):
+    """A thumbnail that is not ASCII base64 is a client error, not a 500."""
+    from unittest.mock import AsyncMock, patch
+
+    from main import app
+
+    unopened = SnippetsDB(tmp_path / "unused.db")  # rejected before any write
+    with patch("main._get_snippets_db", AsyncMock(return_value=unopened)):
+        resp = TestClient(app).post("/snippets", json={
+            "name": "Box", "code": "result = Box(1,1,1)",
+            "thumbnail_png": "data:image/png;base64,é",
+        })
+    assert resp.status_code == 422
+
+
 def test_get_snippets_list(client: TestClient):
     client.post("/snippets", json={"name": "A", "code": "result = Box(1,1,1)"})
     resp = client.get("/snippets")
@@ -1,6 +1,7 @@
 import type React from "react";
 import { useCallback, useEffect, useState } from "react";
 import { saveSnippet, listSnippets, deleteSnippet, executeSnippet, fetchMeshData } from "../api";
+import { API_BASE_URL } from "../config";
 import type { AiCadResult, ObjectMesh, SnippetInfo } from "../types";
 
 
@@ -203,9 +204,9 @@ export default function SnippetLibraryPanel({
                 background: selectedId === s.id ? "var(--sidebar-bg)" : "var(--surface-bg)",
               }}
             >
-              {s.thumbnail_png ? (
+              {s.thumbnail_url ? (
                 <img
-                  src={s.thumbnail_png}
+                  src={`${API_BASE_URL}${s.thumbnail_url}`}
                   alt={s.name}
                   style={{ width: "100%", aspectRatio: "1", objectFit: "cover", borderRadius: 2 }}
                 />
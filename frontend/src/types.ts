@@ -329,7 +329,7 @@ export interface SnippetInfo {
   name: string;
   tags: string[];
   code: string;
-  thumbnail_png: string | null;
+  thumbnail_url: string | null;
   source_generation_id: string | null;
   created_at: string;
 }
@@ -337,6 +337,7 @@ export interface SnippetInfo {
 export interface SnippetListResponse {
   snippets: SnippetInfo[];
   total: number;
+  next_cursor: string | null;
 }
 
 export interface SnippetSaveRequest {